@@ -33,29 +33,48 @@ document.addEventListener('DOMContentLoaded', function() {
             outputDiv.innerHTML = '';
             
             try {
-                const response = await fetch('/api/query', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ 
-                        prompt: userPrompt,
-                        n_results: 3
-                    })
-                });
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
+                // Sources, answer tokens and the collage arrive as separate events
+                const data = {
+                    query: userPrompt,
+                    generated_answer: '',
+                    collage: null,
+                    dialogic_sources: [],
+                    intellectual_sources: []
+                };
+                const palette = pickPalette();
+                let renderPending = false;
                 
-                const data = await response.json();
-                console.log("Results received:", data);
+                const render = () => {
+                    if (renderPending) return;
+                    renderPending = true;
+                    requestAnimationFrame(() => {
+                        renderPending = false;
+                        // Don't paint over an error message
+                        if (!data.error) displayResults(data, palette);
+                    });
+                };
                 
-                // Hide loading
-                if (loadingDiv) loadingDiv.style.display = 'none';
+                await streamQuery(userPrompt, 3, (event, payload) => {
+                    // Hide loading as soon as anything arrives
+                    if (loadingDiv) loadingDiv.style.display = 'none';
+                    
+                    if (event === 'sources') {
+                        data.dialogic_sources = payload.dialogic_sources;
+                        data.intellectual_sources = payload.intellectual_sources;
+                    } else if (event === 'token') {
+                        data.generated_answer += payload.content;
+                    } else if (event === 'collage') {
+                        data.collage = payload.collage;
+                    } else if (event === 'degraded') {
+                        data.degraded = payload.reason;
+                    } else if (event === 'error') {
+                        data.error = payload.error;
+                        throw new Error(payload.error);
+                    }
+                    render();
+                });
                 
-                // Display results
-                displayResults(data);
+                console.log("Results received:", data);
                 
             } catch (error) {
                 console.error("Fetch error:", error);
@@ -68,30 +87,80 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
-function displayResults(data) {
-    const outputDiv = document.getElementById('output-div');
+// POST a query and hand each Server-Sent Event to onEvent(event, payload)
+async function streamQuery(prompt, nResults, onEvent) {
+    const response = await fetch('/api/query/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ 
+            prompt: prompt,
+            n_results: nResults
+        })
+    });
+    
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
     
-    // Pick a random drawing's palette if available
-    let bgGradient = 'linear-gradient(135deg, #f3e5f5 0%, #e1bee7 100%)';
-    let borderColor = '#9c27b0';
-    let textColor = '#222';
-    let usedPalette = null;
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    }
+}
+
+// Pick a random drawing's palette if available
+function pickPalette() {
+    const palette = {
+        bgGradient: 'linear-gradient(135deg, #f3e5f5 0%, #e1bee7 100%)',
+        borderColor: '#9c27b0',
+        textColor: '#222',
+        usedPalette: null
+    };
     
     if (artPalettes) {
         const paletteKeys = Object.keys(artPalettes);
         const randomKey = paletteKeys[Math.floor(Math.random() * paletteKeys.length)];
         const randomPalette = artPalettes[randomKey];
-        usedPalette = randomKey;
+        palette.usedPalette = randomKey;
         
         const colors = randomPalette.hex;
         
         // Use vivid colors for gradient and border
-        bgGradient = `linear-gradient(135deg, ${colors[0]}22 0%, ${colors[1]}33 100%)`;
-        borderColor = colors[2] || colors[0];
+        palette.bgGradient = `linear-gradient(135deg, ${colors[0]}22 0%, ${colors[1]}33 100%)`;
+        palette.borderColor = colors[2] || colors[0];
         
         console.log(`Using colors from drawing: ${randomKey}`, colors);
     }
     
+    return palette;
+}
+
+function displayResults(data, palette = pickPalette()) {
+    const outputDiv = document.getElementById('output-div');
+    const { bgGradient, borderColor, textColor, usedPalette } = palette;
+    
     let html = `<div style="margin-top: 30px;">`;
     html += `<h3 style="color: #333; margin-bottom: 10px;">Response to: "${data.query}"</h3>`;
     
@@ -139,6 +208,12 @@ function displayResults(data) {
         });
         
         html += `</div>`;
+    } else if (data.degraded) {
+        // The model was too busy to answer; the sources below still stand on their own
+        html += `<p style="margin: 20px 0; color: #666; font-style: italic;">
+            Many visitors are asking right now, so there is no synthesized response this time.
+            The materials it would have drawn on are below.
+        </p>`;
     }
     
     // Collapsible sources
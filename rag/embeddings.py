@@ -0,0 +1,282 @@
+"""Selectable embedding backends for all-MiniLM-L6-v2: sentence-transformers (torch) or ONNX Runtime
+
+Every backend is both a Chroma-style embedding function (called with a list
+of texts, returns a list of vectors) and has a SentenceTransformer-style
+encode(texts, batch_size) returning one array, so the API, the retrieval
+engine and the vectorize scripts can swap them freely.
+
+    python rag/embeddings.py export    # torch -> ONNX, plus a dynamically int8-quantized copy
+    python rag/embeddings.py parity    # cosine agreement of the ONNX model with the torch one
+
+EMBEDDING_BACKEND picks the backend: torch (default), onnx (the int8 model)
+or onnx-fp32.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx', MODEL_NAME)
+BACKENDS = ['torch', 'onnx', 'onnx-fp32']
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+
+PARITY_TEXTS = [
+    "what is situated knowledge?",
+    "How does drawing help me think through an idea before I can write it down?",
+    "data bias in machine learning datasets",
+    "I keep getting a KeyError when I loop over the JSON export, can you help me debug this python script?",
+    "posthumanism, agency and the question of who gets to be an author",
+    "the body as a site of knowledge: touch, paper, material practice",
+    "Explain the difference between a chatbot's authority and a teacher's authority.",
+    "sustainability of large language models and their energy use",
+    "Week 6 notes: Haraway, the god trick, and partial perspectives",
+    "art therapy, the senses, and drawing as a way of regulating attention"
+]
+
+
+class SentenceTransformerEmbedder:
+    """The reference backend: the sentence-transformers model on torch"""
+
+    def __init__(self, model_name=MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.max_length = self.model.max_seq_length
+
+    def token_spans(self, texts):
+        """(start, end) character span of every token, untruncated and without special tokens"""
+        encoded = self.model.tokenizer(
+            list(texts), add_special_tokens=False, truncation=False, return_offsets_mapping=True, verbose=False
+        )
+        return [[tuple(span) for span in spans] for spans in encoded['offset_mapping']]
+
+    def encode(self, texts, batch_size=32):
+        return self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+
+    def __call__(self, input):
+        return list(self.encode(input))
+
+
+class OnnxEmbedder:
+    """MiniLM exported to ONNX: tokenizers + onnxruntime, no torch at run time.
+
+    Mean pooling over the attention mask followed by L2 normalization
+    reproduces the sentence-transformers pipeline. Tokenized texts are kept
+    in an LRU cache, since the same queries and documents come back often.
+    """
+
+    def __init__(self, model_dir=ONNX_DIR, quantized=True, threads=None, cache_size=4096):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, 'embedding_config.json')) as f:
+            self.config = json.load(f)
+        self.max_length = self.config["max_length"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.no_padding()
+        # A second copy that never truncates, for measuring and splitting documents
+        self._span_tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self._span_tokenizer.no_truncation()
+        self._span_tokenizer.no_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = 'model.int8.onnx' if quantized else 'model.onnx'
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # text -> token ids
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def tokenize(self, texts):
+        """Token ids per text, from the cache where possible"""
+        ids = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                cached = self._cache.get(text)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(text)
+                    ids[i] = cached
+            self.cache_hits += len(texts) - len(missing)
+            self.cache_misses += len(missing)
+
+        if missing:
+            encodings = self.tokenizer.encode_batch([texts[i] for i in missing])
+            with self._lock:
+                for i, encoding in zip(missing, encodings):
+                    ids[i] = np.asarray(encoding.ids, dtype=np.int64)
+                    self._cache[texts[i]] = ids[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return ids
+
+    def token_spans(self, texts):
+        """(start, end) character span of every token, untruncated and without special tokens"""
+        encodings = self._span_tokenizer.encode_batch(list(texts), add_special_tokens=False)
+        return [encoding.offsets for encoding in encodings]
+
+    def _run(self, token_ids):
+        """One padded batch through the model, mean-pooled and normalized"""
+        length = max(len(ids) for ids in token_ids)
+        input_ids = np.zeros((len(token_ids), length), dtype=np.int64)
+        attention_mask = np.zeros((len(token_ids), length), dtype=np.int64)
+        for row, ids in enumerate(token_ids):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.config["dim"]), dtype=np.float32)
+        token_ids = self.tokenize(texts)
+        # Batch texts of similar length together so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(token_ids[i]))
+        embeddings = np.empty((len(texts), self.config["dim"]), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._run([token_ids[i] for i in rows])
+        return embeddings
+
+    def __call__(self, input):
+        return list(self.encode(input))
+
+
+def load_embedding_function(backend=None, model_name=MODEL_NAME, model_dir=ONNX_DIR):
+    """The embedding backend named by `backend` (default: EMBEDDING_BACKEND)"""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == 'torch':
+        return SentenceTransformerEmbedder(model_name)
+    if backend in ('onnx', 'onnx-fp32'):
+        if not os.path.exists(os.path.join(model_dir, 'embedding_config.json')):
+            raise FileNotFoundError(f"No ONNX export in {model_dir}; run `python rag/embeddings.py export` first")
+        return OnnxEmbedder(model_dir, quantized=backend == 'onnx')
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+
+def export_onnx(model_name=MODEL_NAME, output_dir=ONNX_DIR, opset=17):
+    """Export the transformer to ONNX, save its tokenizer, and write an int8 copy"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    class Encoder(torch.nn.Module):
+        """Keyword-only call into the HF model, so the export doesn't depend on forward()'s argument order"""
+
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.transformer(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            )[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device='cpu')
+    encoder = Encoder(model[0].auto_model).eval()
+    sample = model.tokenizer(["a short sample sentence", "another one"], padding=True, return_tensors='pt')
+
+    fp32_path = os.path.join(output_dir, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder,
+            (sample['input_ids'], sample['attention_mask'], sample['token_type_ids']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'token_type_ids': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'}
+            },
+            opset_version=opset,
+            dynamo=False
+        )
+    # Dynamic quantization: int8 weights, activations quantized on the fly
+    quantize_dynamic(fp32_path, os.path.join(output_dir, 'model.int8.onnx'), weight_type=QuantType.QInt8)
+
+    model.tokenizer.save_pretrained(output_dir)
+    with torch.no_grad(), open(os.path.join(output_dir, 'embedding_config.json'), 'w') as f:
+        json.dump({
+            "model": model_name,
+            "max_length": model.max_seq_length,
+            "dim": int(encoder(**sample).shape[-1])
+        }, f, indent=2)
+    return output_dir
+
+
+def check_parity(reference, candidate, texts, threshold=0.99):
+    """Cosine similarity between two backends' embeddings of the same texts"""
+    expected = np.asarray(reference.encode(texts), dtype=np.float32)
+    actual = np.asarray(candidate.encode(texts), dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True)
+    cosine = (expected * actual).sum(axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": round(float(cosine.min()), 5),
+        "mean_cosine": round(float(cosine.mean()), 5),
+        "threshold": threshold,
+        "passed": bool(cosine.min() >= threshold)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and check the ONNX embedding backend")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help="export the torch model to ONNX (fp32 + int8)")
+    export.add_argument('--model', default=MODEL_NAME)
+    export.add_argument('--output', default=ONNX_DIR)
+    parity = sub.add_parser('parity', help="compare ONNX embeddings with the torch model")
+    parity.add_argument('--model', default=MODEL_NAME)
+    parity.add_argument('--model-dir', default=ONNX_DIR)
+    parity.add_argument('--texts', help="file with one text per line (default: built-in sample)")
+    parity.add_argument('--threshold', type=float, default=0.99, help="minimum cosine similarity to pass")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        path = export_onnx(args.model, args.output)
+        print(f"✓ Exported {args.model} to {path}")
+        return
+
+    texts = PARITY_TEXTS
+    if args.texts:
+        with open(args.texts, encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+    reference = SentenceTransformerEmbedder(args.model)
+    failed = False
+    for backend in ('onnx-fp32', 'onnx'):
+        result = check_parity(reference, load_embedding_function(backend, args.model, args.model_dir), texts, args.threshold)
+        print(f"{backend}: {json.dumps(result)}")
+        failed = failed or not result["passed"]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
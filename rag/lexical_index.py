@@ -0,0 +1,221 @@
+"""BM25 inverted index over each collection's documents, memory-mapped at query time
+
+Built by the vectorize scripts alongside the embeddings, or from an existing
+Chroma database with
+
+    python rag/lexical_index.py
+
+which writes one directory per collection under rag/lexical_index/:
+
+    index.json       name, document count, average length, BM25 parameters
+    terms.npy        sorted vocabulary (fixed-width unicode, binary-searched)
+    offsets.npy      int64 start of every term's postings, plus the end
+    postings.npy     int32 document rows, grouped by term
+    frequencies.npy  uint16 term frequency per posting
+    lengths.npy      int32 token count per document
+    meta.parquet     id, document and JSON-encoded metadata per row
+
+Names of theorists, course terms and conversation titles are exactly what
+MiniLM tends to blur, so RetrievalEngine fuses these rankings with the
+vector ones (reciprocal rank fusion) instead of asking for a larger k.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from vector_index import MetadataColumns, read_meta, write_meta
+
+LEXICAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexical_index')
+CHROMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chroma_db')
+COLLECTIONS = ["dialogic_inquiry", "intellectual_inquiry"]
+
+# Standard BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Longer tokens are URLs, hashes and base64 noise, not search terms
+MAX_TERM_LENGTH = 32
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been but by can could did do does doing for from
+had has have he her here him his how i if in into is it its just me more most my no not of on one or our out
+over she so some such than that the their them then there these they this those to too up us very was we
+were what when where which while who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords or overlong strings"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS and len(token) <= MAX_TERM_LENGTH
+    ]
+
+
+class LexicalIndexBuilder:
+    """Collects documents in row order, then writes the index directory in one go"""
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.vocabulary = {}
+        self._terms = array('i')
+        self._rows = array('i')
+        self._frequencies = array('H')
+        self._lengths = array('i')
+
+    def add(self, doc_id, document, metadata=None):
+        row = len(self.ids)
+        tokens = tokenize(document)
+        for term, count in Counter(tokens).items():
+            self._terms.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            self._rows.append(row)
+            self._frequencies.append(min(count, 65535))
+        self._lengths.append(len(tokens))
+        self.ids.append(doc_id)
+        self.documents.append(document)
+        self.metadatas.append(metadata)
+
+    def write(self):
+        """Write to a sibling directory, then swap it in; open readers keep their mmaps"""
+        terms = sorted(self.vocabulary)
+        # Renumber term ids by sorted position so postings line up with terms.npy
+        rank = np.empty(len(terms), dtype=np.int64)
+        rank[[self.vocabulary[t] for t in terms]] = np.arange(len(terms))
+        term_rows = rank[np.frombuffer(self._terms, dtype=np.int32)]
+        order = np.argsort(term_rows, kind='stable')
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_rows, minlength=len(terms)), out=offsets[1:])
+        lengths = np.frombuffer(self._lengths, dtype=np.int32)
+
+        tmp_path = self.path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        width = max((len(t) for t in terms), default=1)
+        np.save(os.path.join(tmp_path, 'terms.npy'), np.array(terms, dtype=f'<U{width}'))
+        np.save(os.path.join(tmp_path, 'offsets.npy'), offsets)
+        np.save(os.path.join(tmp_path, 'postings.npy'), np.frombuffer(self._rows, dtype=np.int32)[order])
+        np.save(os.path.join(tmp_path, 'frequencies.npy'), np.frombuffer(self._frequencies, dtype=np.uint16)[order])
+        np.save(os.path.join(tmp_path, 'lengths.npy'), lengths)
+        write_meta(tmp_path, self.ids, self.documents, self.metadatas)
+        with open(os.path.join(tmp_path, 'index.json'), 'w') as f:
+            json.dump({
+                "name": self.name,
+                "count": len(self.ids),
+                "terms": len(terms),
+                "postings": len(order),
+                "avg_length": float(lengths.mean()) if len(lengths) else 0.0,
+                "k1": K1,
+                "b": B
+            }, f, indent=2)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        return len(self.ids)
+
+
+class LexicalIndex:
+    """BM25 search with Chroma's result shape; "scores" replaces "distances" (higher is better)"""
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        with open(os.path.join(path, 'index.json')) as f:
+            self.info = json.load(f)
+        self.name = self.info["name"]
+        self.terms = np.load(os.path.join(path, 'terms.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.postings = np.load(os.path.join(path, 'postings.npy'), mmap_mode='r')
+        self.frequencies = np.load(os.path.join(path, 'frequencies.npy'), mmap_mode='r')
+        self.meta = pq.read_table(os.path.join(path, 'meta.parquet'), memory_map=True)
+        self.columns = MetadataColumns(self.meta)
+
+        # Per-document part of the BM25 denominator, computed once
+        k1, b = self.info["k1"], self.info["b"]
+        lengths = np.load(os.path.join(path, 'lengths.npy'), mmap_mode='r')
+        avg_length = self.info["avg_length"] or 1.0
+        self._length_norm = (k1 * (1 - b + b * np.asarray(lengths, dtype=np.float32) / avg_length)).astype(np.float32)
+
+    def count(self):
+        return self.info["count"]
+
+    def _term_row(self, term):
+        row = int(np.searchsorted(self.terms, term))
+        if row < len(self.terms) and self.terms[row] == term:
+            return row
+        return None
+
+    def scores(self, text):
+        """BM25 score of every document for one query (zeros where no term matches)"""
+        scores = np.zeros(self.count(), dtype=np.float32)
+        k1, n = self.info["k1"], self.count()
+        for term, weight in Counter(tokenize(text)).items():
+            row = self._term_row(term)
+            if row is None:
+                continue
+            start, stop = int(self.offsets[row]), int(self.offsets[row + 1])
+            rows = self.postings[start:stop]
+            tf = self.frequencies[start:stop].astype(np.float32)
+            idf = np.log(1 + (n - (stop - start) + 0.5) / ((stop - start) + 0.5))
+            scores[rows] += weight * idf * tf * (k1 + 1) / (tf + self._length_norm[rows])
+        return scores
+
+    def query(self, query_texts, n_results=10, where=None):
+        result = {"ids": [], "documents": [], "metadatas": [], "scores": []}
+        allowed = self.columns.mask(where) if where else None
+        for text in query_texts:
+            scores = self.scores(text)
+            if allowed is not None:
+                scores[~allowed] = 0.0
+            matched = np.flatnonzero(scores)
+            k = min(n_results, len(matched))
+            top = matched[np.argpartition(-scores[matched], k - 1)[:k]] if 0 < k < len(matched) else matched
+            top = top[np.argsort(-scores[top], kind='stable')]
+            ids, documents, metadatas = read_meta(self.meta, top) if len(top) else ([], [], [])
+            result["ids"].append(ids)
+            result["documents"].append(documents)
+            result["metadatas"].append(metadatas)
+            result["scores"].append(scores[top].tolist())
+        return result
+
+
+def build_from_collection(collection, path, page_size=1000):
+    """Index the documents an existing Chroma collection already holds"""
+    builder = LexicalIndexBuilder(path, collection.name)
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=['documents', 'metadatas'])
+        if not page['ids']:
+            break
+        for doc_id, document, metadata in zip(page['ids'], page['documents'], page['metadatas']):
+            builder.add(doc_id, document or "", metadata)
+        offset += len(page['ids'])
+    return builder.write()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build BM25 indexes from the Chroma collections")
+    parser.add_argument('--chroma-path', default=CHROMA_PATH)
+    parser.add_argument('--output', default=LEXICAL_DIR)
+    parser.add_argument('--collections', nargs='+', default=COLLECTIONS)
+    args = parser.parse_args()
+
+    import chromadb
+    client = chromadb.PersistentClient(path=args.chroma_path)
+    for name in args.collections:
+        path = os.path.join(args.output, name)
+        count = build_from_collection(client.get_collection(name), path)
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print(f"✓ {name}: {count} documents -> {path} ({size / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
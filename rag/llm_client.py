@@ -0,0 +1,90 @@
+"""Long-lived Ollama client that keeps llama3.2 loaded between visitors"""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger("portrait.llm")
+
+DEFAULT_MODEL = os.environ.get('LLM_MODEL', 'llama3.2')
+
+
+def parse_keep_alive(value):
+    """Ollama takes a duration string ('30m') or a number of seconds (-1 = forever)"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class LLMClient:
+    """One pooled HTTP connection to Ollama, shared by every request thread.
+
+    Every call passes keep_alive so Ollama keeps the model resident, and an
+    optional heartbeat thread reloads it after idle periods, or after Ollama
+    itself restarts, before the next visitor has to wait for it.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, host=None, keep_alive='30m', timeout=120.0, heartbeat_interval=600):
+        import ollama
+        self.model = model
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.heartbeat_interval = heartbeat_interval
+        # ollama.Client wraps an httpx.Client, which pools and reuses connections;
+        # host=None falls back to OLLAMA_HOST or localhost
+        self._client = ollama.Client(host=host, timeout=timeout)
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.warm = False
+        self.last_used = None
+        self.heartbeats = 0
+        self.failures = 0
+
+    def chat(self, messages, options=None, stream=False):
+        """ollama.chat against the pinned model; with stream=True returns the chunk iterator"""
+        self.last_used = time.monotonic()
+        return self._client.chat(
+            model=self.model,
+            messages=messages,
+            options=options,
+            stream=stream,
+            keep_alive=self.keep_alive
+        )
+
+    def load(self):
+        """Load the model without generating anything (an empty prompt only loads it)"""
+        try:
+            self._client.generate(model=self.model, prompt='', keep_alive=self.keep_alive)
+            self.warm = True
+        except Exception as e:
+            self.warm = False
+            self.failures += 1
+            log.warning("Could not load %s: %s", self.model, e)
+        return self.warm
+
+    def start_heartbeat(self):
+        if self.heartbeat_interval and self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, name="llm-heartbeat", daemon=True)
+            self._heartbeat.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            # Real traffic already keeps the model loaded
+            if self.last_used is not None and time.monotonic() - self.last_used < self.heartbeat_interval:
+                continue
+            self.heartbeats += 1
+            self.load()
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "keep_alive": self.keep_alive,
+            "warm": self.warm,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1) if self.last_used is not None else None,
+            "heartbeats": self.heartbeats,
+            "failures": self.failures
+        }
@@ -1,25 +1,384 @@
-import chromadb
-from chromadb.utils import embedding_functions
-import openai  # or use a local model like llama
-
-client = chromadb.PersistentClient(path="./rag/chroma_db")
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
-
-def query_rag(user_prompt, n_results=5):
-    # Query both collections
-    dialogic = client.get_collection("dialogic_inquiry", embedding_function=sentence_transformer_ef)
-    intellectual = client.get_collection("intellectual_inquiry", embedding_function=sentence_transformer_ef)
-    
-    dialogic_results = dialogic.query(query_texts=[user_prompt], n_results=n_results)
-    intellectual_results = intellectual.query(query_texts=[user_prompt], n_results=n_results)
-    
-    # Combine context
-    context = "Dialogic Context:\n" + "\n".join(dialogic_results['documents'][0])
-    context += "\n\nIntellectual Context:\n" + "\n".join(intellectual_results['documents'][0])
-    
-    # Generate response (using OpenAI or local model)
-    # This is where you'd call your LLM with the context + user prompt
-    
-    return context  # For now, return raw context for prototype
\ No newline at end of file
+"""Retrieval over both inquiry collections, shared by the API server and offline scripts"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+CHROMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chroma_db')
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+DIALOGIC_HEADER = "=== From Your ChatGPT Conversations ==="
+INTELLECTUAL_HEADER = "\n=== From Your Class Notes ==="
+
+
+def estimate_tokens(text):
+    """Rough llama-style token count (~4 characters per token) for budgeting"""
+    return len(text) // 4 + 1
+
+
+# Reciprocal rank fusion constant; larger values flatten the gap between ranks
+RRF_K = 60
+
+
+@dataclass
+class Source:
+    id: str
+    content: str
+    metadata: dict
+    distance: float = None
+    score: float = None  # fused RRF score when hybrid retrieval ranked it
+
+    def to_dict(self, scores=False):
+        data = {"content": self.content, "metadata": self.metadata}
+        if scores:
+            data.update(id=self.id, distance=self.distance)
+            if self.score is not None:
+                data["score"] = self.score
+        return data
+
+
+@dataclass
+class Retrieval:
+    query: str
+    dialogic: list = field(default_factory=list)
+    intellectual: list = field(default_factory=list)
+    embedding: object = None
+
+    def to_dict(self, scores=False):
+        """The sources as the API returns them; scores adds ids and distances for evaluation"""
+        return {
+            "query": self.query,
+            "dialogic_sources": [s.to_dict(scores) for s in self.dialogic],
+            "intellectual_sources": [s.to_dict(scores) for s in self.intellectual]
+        }
+
+
+def parse_time(value, end=False):
+    """Epoch seconds from a number or an ISO date/datetime (naive means UTC).
+
+    A bare date as the end of a range covers that whole day.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Expected a date, datetime or epoch seconds, got {value!r}")
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Not an ISO date or datetime: {value!r}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        return int((moment + timedelta(days=1)).timestamp()) - 1
+    return int(moment.timestamp())
+
+
+@dataclass
+class TranscriptFilter:
+    """Restrictions on the transcript (dialogic) side of a retrieval.
+
+    roles, the time range and conversations become a Chroma where clause on
+    the has_<role>, timestamp_epoch and conversation metadata, so both the
+    vector and the BM25 search only rank matching chunks; a chunk merging
+    several turns matches each role among them. A conversation is named
+    by its conversation_id (one conversation) or its title (every
+    conversation with that title). per_conversation caps how many sources
+    one conversation_id may contribute. The class notes carry none of this
+    metadata and are never filtered.
+    """
+    roles: list = None
+    since: int = None
+    until: int = None
+    conversations: list = None
+    per_conversation: int = None
+
+    @classmethod
+    def from_request(cls, filters):
+        """Build from a request's "filters" object; raises ValueError on bad input"""
+        if not filters:
+            return cls()
+        if not isinstance(filters, dict):
+            raise ValueError("filters must be an object")
+        unknown = set(filters) - {"role", "since", "until", "conversation", "per_conversation"}
+        if unknown:
+            raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+        def names(value, label):
+            if value is None:
+                return None
+            values = [value] if isinstance(value, str) else value
+            if not isinstance(values, list) or not values or not all(isinstance(v, str) for v in values):
+                raise ValueError(f"{label} must be a string or a non-empty list of strings")
+            return sorted(set(values))
+
+        per_conversation = filters.get("per_conversation")
+        if per_conversation is not None and (not isinstance(per_conversation, int) or per_conversation < 1):
+            raise ValueError("per_conversation must be a positive integer")
+        result = cls(
+            roles=names(filters.get("role"), "role"),
+            since=parse_time(filters["since"]) if filters.get("since") is not None else None,
+            until=parse_time(filters["until"], end=True) if filters.get("until") is not None else None,
+            conversations=names(filters.get("conversation"), "conversation"),
+            per_conversation=per_conversation
+        )
+        if result.since is not None and result.until is not None and result.since > result.until:
+            raise ValueError("since is after until")
+        return result
+
+    def where(self):
+        """Chroma where clause, or None when nothing is filtered"""
+        clauses = []
+        if self.roles:
+            # Chroma's $or needs at least two clauses
+            has_role = [{f"has_{role}": {"$eq": True}} for role in self.roles]
+            clauses.append(has_role[0] if len(has_role) == 1 else {"$or": has_role})
+        if self.since is not None:
+            clauses.append({"timestamp_epoch": {"$gte": self.since}})
+        if self.until is not None:
+            clauses.append({"timestamp_epoch": {"$lte": self.until}})
+        if self.conversations:
+            clauses.append({"$or": [
+                {"conversation_id": {"$in": self.conversations}},
+                {"conversation_title": {"$in": self.conversations}}
+            ]})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def cache_scope(self):
+        """Stable text identifying the filter, so filtered answers get their own cache entries"""
+        fields = {k: v for k, v in self.__dict__.items() if v is not None}
+        return json.dumps(fields, sort_keys=True) if fields else ""
+
+
+def dedupe_conversations(sources, limit, k):
+    """Best-first sources with at most limit from any one conversation"""
+    kept, counts = [], {}
+    for source in sources:
+        metadata = source.metadata or {}
+        group = metadata.get("conversation_id") or metadata.get("conversation_title")
+        if counts.get(group, 0) >= limit:
+            continue
+        counts[group] = counts.get(group, 0) + 1
+        kept.append(source)
+        if len(kept) == k:
+            break
+    return kept
+
+
+def _sources(results, row):
+    """Unpack one query's row of a Chroma result into Sources"""
+    ids = results['ids'][row]
+    distances = results['distances'][row] if results.get('distances') else [None] * len(ids)
+    return [
+        Source(id=id_, content=doc, metadata=meta, distance=dist)
+        for id_, doc, meta, dist in zip(ids, results['documents'][row], results['metadatas'][row], distances)
+    ]
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """Merge ranked Source lists by summing 1 / (rrf_k + rank); the first list's copy of a source wins"""
+    fused, scores = {}, {}
+    for ranking in rankings:
+        for rank, source in enumerate(ranking):
+            fused.setdefault(source.id, source)
+            scores[source.id] = scores.get(source.id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    for source_id in best:
+        fused[source_id].score = round(scores[source_id], 6)
+    return [fused[source_id] for source_id in best]
+
+
+class RetrievalEngine:
+    """Opens the index, the embedding model and both collections once.
+
+    backend is 'chroma' (the persistent Chroma client) or 'numpy' (the
+    memory-mapped export written by rag/vector_index.py); both answer the
+    same query() calls. Safe to share between threads: embedding calls are
+    serialized (torch already parallelizes inside one call) and the two
+    collections are searched side by side on a small pool.
+
+    When BM25 indexes exist in lexical_dir (see rag/lexical_index.py),
+    retrieval is hybrid: each side takes fusion_depth candidates from the
+    vectors and from BM25 and keeps the top k by reciprocal rank fusion.
+    hybrid=False, or a missing index, leaves plain vector search.
+    """
+
+    def __init__(self, chroma_path=CHROMA_PATH, model_name=MODEL_NAME, token_counter=estimate_tokens,
+                 backend='chroma', index_dir=None, embedding_backend=None,
+                 hybrid=True, lexical_dir=None, fusion_depth=20, dense_mb=0):
+        from embeddings import load_embedding_function
+
+        # torch or ONNX (see rag/embeddings.py); both give the same vectors within parity
+        self.embedding_function = load_embedding_function(embedding_backend, model_name)
+        if backend == 'numpy':
+            from vector_index import INDEX_DIR, NumpyCollection
+            index_dir = index_dir or INDEX_DIR
+            self.client = None
+            self.dialogic = NumpyCollection(os.path.join(index_dir, "dialogic_inquiry"), dense_mb)
+            self.intellectual = NumpyCollection(os.path.join(index_dir, "intellectual_inquiry"), dense_mb)
+        elif backend == 'chroma':
+            import chromadb
+
+            self.client = chromadb.PersistentClient(path=chroma_path)
+            self.dialogic = self.client.get_collection("dialogic_inquiry", embedding_function=self.embedding_function)
+            self.intellectual = self.client.get_collection("intellectual_inquiry", embedding_function=self.embedding_function)
+        else:
+            raise ValueError(f"Unknown retrieval backend: {backend}")
+        self.backend = backend
+        self.token_counter = token_counter
+
+        self.lexical = None
+        if hybrid:
+            from lexical_index import LEXICAL_DIR, LexicalIndex
+            lexical_dir = lexical_dir or LEXICAL_DIR
+            paths = [os.path.join(lexical_dir, name) for name in ("dialogic_inquiry", "intellectual_inquiry")]
+            if all(os.path.exists(os.path.join(path, 'index.json')) for path in paths):
+                self.lexical = {"dialogic": LexicalIndex(paths[0]), "intellectual": LexicalIndex(paths[1])}
+        self.fusion_depth = fusion_depth
+
+        self._embed_lock = threading.Lock()
+        self._search_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="chroma-search")
+
+    @property
+    def hybrid(self):
+        return self.lexical is not None
+
+    def counts(self):
+        return {"dialogic": self.dialogic.count(), "intellectual": self.intellectual.count()}
+
+    def embed(self, queries, timer=None):
+        """Embed a list of queries in one batched model call"""
+        with (timer.stage('embed') if timer else nullcontext()), self._embed_lock:
+            return self.embedding_function(list(queries))
+
+    def _search(self, collection, stage, timer, embeddings, k, where=None):
+        with timer.stage(stage) if timer else nullcontext():
+            if where is None:
+                return collection.query(query_embeddings=embeddings, n_results=k)
+            return collection.query(query_embeddings=embeddings, n_results=k, where=where)
+
+    def _search_lexical(self, timer, queries, depths, where):
+        with timer.stage('search_lexical') if timer else nullcontext():
+            return {
+                side: index.query(queries, depths[side], where if side == "dialogic" else None)
+                for side, index in self.lexical.items()
+            }
+
+    def retrieve_many(self, queries, k=3, query_embeddings=None, timer=None, filters=None):
+        """One embedding batch and one multi-query search per collection for all queries.
+
+        filters is a TranscriptFilter; its where clause is pushed into the
+        dialogic searches and per-conversation dedup runs on the results.
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        if query_embeddings is None:
+            query_embeddings = self.embed(queries, timer)
+        filters = filters or TranscriptFilter()
+        where = filters.where()
+
+        # Fusion needs candidates below the top k from both rankings, and dedup
+        # needs enough of them to still fill k after dropping repeats
+        depth = max(k, self.fusion_depth) if self.hybrid else k
+        depths = {"dialogic": depth, "intellectual": depth}
+        if filters.per_conversation:
+            depths["dialogic"] = max(depth, 4 * k)
+        dialogic_future = self._search_pool.submit(
+            self._search, self.dialogic, 'search_dialogic', timer, query_embeddings, depths["dialogic"], where
+        )
+        intellectual_future = self._search_pool.submit(
+            self._search, self.intellectual, 'search_intellectual', timer, query_embeddings, depths["intellectual"]
+        )
+        lexical_future = self._search_pool.submit(
+            self._search_lexical, timer, queries, depths, where
+        ) if self.hybrid else None
+        results = {"dialogic": dialogic_future.result(), "intellectual": intellectual_future.result()}
+        lexical_results = lexical_future.result() if lexical_future else None
+
+        def ranked(side, row):
+            sources = _sources(results[side], row)
+            if lexical_results is not None:
+                sources = reciprocal_rank_fusion([sources, _sources(lexical_results[side], row)], depths[side])
+            if side == "dialogic" and filters.per_conversation:
+                return dedupe_conversations(sources, filters.per_conversation, k)
+            return sources[:k]
+
+        with timer.stage('fusion') if timer and self.hybrid else nullcontext():
+            return [
+                Retrieval(
+                    query=query,
+                    dialogic=ranked("dialogic", row),
+                    intellectual=ranked("intellectual", row),
+                    embedding=query_embeddings[row]
+                )
+                for row, query in enumerate(queries)
+            ]
+
+    def retrieve(self, query, k=3, query_embedding=None, timer=None, filters=None):
+        """Search both collections for one query; query_embedding is a one-item list as embed() returns"""
+        return self.retrieve_many([query], k, query_embedding, timer, filters)[0]
+
+    def build_context(self, retrieval, max_tokens=None):
+        """Format retrieved sources for the prompt, keeping at most max_tokens of it.
+
+        Sources are admitted best-first, alternating between the two
+        collections, so a tight budget keeps the top hits from each side; the
+        last one that fits partially is truncated.
+        """
+        dialogic_parts = [
+            f"[Conversation: {s.metadata['conversation_title']}]\n{s.content}\n" for s in retrieval.dialogic
+        ]
+        intellectual_parts = [f"[Note {i+1}]\n{s.content}\n" for i, s in enumerate(retrieval.intellectual)]
+
+        if max_tokens is not None:
+            remaining = max_tokens - self.token_counter(DIALOGIC_HEADER + INTELLECTUAL_HEADER)
+            kept = {"dialogic": [], "intellectual": []}
+            ranked = []
+            for rank in range(max(len(dialogic_parts), len(intellectual_parts))):
+                if rank < len(dialogic_parts):
+                    ranked.append(("dialogic", dialogic_parts[rank]))
+                if rank < len(intellectual_parts):
+                    ranked.append(("intellectual", intellectual_parts[rank]))
+            for side, part in ranked:
+                cost = self.token_counter(part)
+                if cost > remaining:
+                    if remaining > 32:
+                        # Cut by the same ratio; the counter is an estimate anyway
+                        kept[side].append(part[:int(len(part) * remaining / cost)] + "...\n")
+                    break
+                kept[side].append(part)
+                remaining -= cost
+            dialogic_parts, intellectual_parts = kept["dialogic"], kept["intellectual"]
+
+        return "\n".join([DIALOGIC_HEADER, *dialogic_parts, INTELLECTUAL_HEADER, *intellectual_parts])
+
+
+_default_engine = None
+
+
+def default_engine():
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = RetrievalEngine()
+    return _default_engine
+
+
+def query_rag(user_prompt, n_results=5, llm=None, max_tokens=None):
+    retrieval = default_engine().retrieve(user_prompt, n_results)
+    context = default_engine().build_context(retrieval, max_tokens)
+
+    # Generate response with the local model when a client is plugged in
+    # (e.g. llm_client.LLMClient(), the same client the API server uses)
+    if llm is None:
+        return context  # For now, return raw context for prototype
+
+    response = llm.chat([
+        {'role': 'system', 'content': "Answer the question using the provided context."},
+        {'role': 'user', 'content': f"{context}\n\nQuestion: {user_prompt}"}
+    ])
+    return response['message']['content']
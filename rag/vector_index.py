@@ -0,0 +1,274 @@
+"""In-process brute-force vector index exported from Chroma
+
+    python rag/vector_index.py --dtype int8
+
+writes one directory per collection under rag/vector_index/:
+
+    index.json     name, count, dim, dtype, distance space, embedding model
+    vectors.npy    float16 rows, or int8 rows with a float32 scale per row (scales.npy)
+    norms.npy      float32 norm of every original vector, for l2/cosine distances
+    meta.parquet   id, document and JSON-encoded metadata per row
+
+The collections are a few thousand rows, so one memory-mapped matrix product
+plus argpartition beats walking Chroma's SQLite/HNSW layers, and the
+directory can simply be copied to another machine.
+
+Rows stay memory-mapped in their stored dtype and are dequantized block by
+block per query, so resident memory is what the OS pages in. Decoding the
+whole matrix to float32 once (max_dense_mb, VECTOR_DENSE_MB in the API)
+makes each query a few milliseconds faster but holds 2x (float16) or 4x
+(int8) the file size in RAM.
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vector_index')
+CHROMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chroma_db')
+COLLECTIONS = ["dialogic_inquiry", "intellectual_inquiry"]
+
+# Rows dequantized per matrix product; bounds the float32 scratch memory
+BLOCK_ROWS = 16384
+
+
+def quantize(vectors, dtype):
+    """float16 as-is, or symmetric per-row int8 with a scale per row"""
+    if dtype == 'float16':
+        return vectors.astype(np.float16), None
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported dtype: {dtype}")
+
+
+def write_meta(path, ids, documents, metadatas):
+    """meta.parquet: id, document and JSON-encoded metadata, in row order"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pq.write_table(pa.table({
+        'id': pa.array(ids, pa.string()),
+        'document': pa.array(documents, pa.string()),
+        'metadata': pa.array([json.dumps(m, ensure_ascii=False) if m is not None else None for m in metadatas], pa.string())
+    }), os.path.join(path, 'meta.parquet'))
+
+
+def read_meta(meta, rows):
+    """ids, documents and decoded metadata of the given rows of a meta.parquet table"""
+    columns = meta.take(rows).to_pydict()
+    metadatas = [json.loads(m) if m is not None else None for m in columns['metadata']]
+    return columns['id'], columns['document'], metadatas
+
+
+class MetadataColumns:
+    """Columns of one meta.parquet's metadata, decoded once, for evaluating Chroma-style where filters.
+
+    Supports $eq, $ne, $gt, $gte, $lt, $lte, $in and $nin on single keys,
+    combined with $and / $or, so a filter that Chroma would push into its
+    SQLite query becomes a boolean row mask here instead of a post-filter.
+    """
+
+    COMPARISONS = {
+        "$eq": np.equal, "$ne": np.not_equal,
+        "$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal
+    }
+
+    def __init__(self, meta):
+        self.meta = meta
+        self._columns = None
+        self._lock = threading.Lock()
+
+    def column(self, key):
+        with self._lock:
+            if self._columns is None:
+                metadatas = [json.loads(m) if m is not None else {} for m in self.meta.column('metadata').to_pylist()]
+                keys = {k for m in metadatas for k in m}
+                self._columns = {}
+                for k in keys:
+                    values = [m.get(k) for m in metadatas]
+                    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values if v is not None):
+                        self._columns[k] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+                    else:
+                        self._columns[k] = np.array(values, dtype=object)
+        if key not in self._columns:
+            return np.full(self.meta.num_rows, None, dtype=object)
+        return self._columns[key]
+
+    def mask(self, where):
+        """Boolean mask of the rows matching a where filter"""
+        masks = []
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                parts = [self.mask(clause) for clause in condition]
+                masks.append(np.logical_and.reduce(parts) if key == "$and" else np.logical_or.reduce(parts))
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            column = self.column(key)
+            for op, value in condition.items():
+                if op in ("$in", "$nin"):
+                    if column.dtype == object:
+                        values = set(value)
+                        match = np.fromiter((v in values for v in column), dtype=bool, count=len(column))
+                    else:
+                        match = np.isin(column, list(value))
+                    masks.append(match if op == "$in" else ~match)
+                elif op in self.COMPARISONS:
+                    if column.dtype == object and op not in ("$eq", "$ne"):
+                        raise ValueError(f"{op} needs a numeric metadata field, {key} is not")
+                    with np.errstate(invalid='ignore'):
+                        masks.append(self.COMPARISONS[op](column, value).astype(bool))
+                else:
+                    raise ValueError(f"Unsupported where operator: {op}")
+        return np.logical_and.reduce(masks) if masks else np.ones(self.meta.num_rows, dtype=bool)
+
+
+def write_index(path, name, ids, documents, metadatas, embeddings, dtype='float16', space='l2', model=None):
+    os.makedirs(path, exist_ok=True)
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+    quantized, scales = quantize(vectors, dtype)
+    np.save(os.path.join(path, 'vectors.npy'), quantized)
+    np.save(os.path.join(path, 'norms.npy'), np.linalg.norm(vectors, axis=1).astype(np.float32))
+    if scales is not None:
+        np.save(os.path.join(path, 'scales.npy'), scales)
+
+    write_meta(path, ids, documents, metadatas)
+
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump({
+            "name": name,
+            "count": len(ids),
+            "dim": int(vectors.shape[1]) if len(ids) else 0,
+            "dtype": dtype,
+            "space": space,
+            "model": model
+        }, f, indent=2)
+
+
+def export_collection(collection, path, dtype='float16', page_size=1000, model=None):
+    """Copy a Chroma collection's embeddings, documents and metadata into an index directory"""
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=['embeddings', 'documents', 'metadatas'])
+        if not page['ids']:
+            break
+        ids.extend(page['ids'])
+        documents.extend(page['documents'])
+        metadatas.extend(page['metadatas'])
+        embeddings.extend(page['embeddings'])
+        offset += len(page['ids'])
+
+    space = (collection.metadata or {}).get('hnsw:space', 'l2')
+    write_index(path, collection.name, ids, documents, metadatas, embeddings, dtype, space, model)
+    return len(ids)
+
+
+class NumpyCollection:
+    """Read-only stand-in for a Chroma collection: query() and count() with the same result shape.
+
+    Distances follow the collection's Chroma space (squared L2 by default),
+    so scores are comparable with what Chroma returned.
+    """
+
+    def __init__(self, path, max_dense_mb=0):
+        import pyarrow.parquet as pq
+
+        with open(os.path.join(path, 'index.json')) as f:
+            self.info = json.load(f)
+        self.name = self.info["name"]
+        self.space = self.info["space"]
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self.norms = np.load(os.path.join(path, 'norms.npy'), mmap_mode='r')
+        scales_path = os.path.join(path, 'scales.npy')
+        self.scales = np.load(scales_path, mmap_mode='r') if os.path.exists(scales_path) else None
+        self.meta = pq.read_table(os.path.join(path, 'meta.parquet'), memory_map=True)
+        self.columns = MetadataColumns(self.meta)
+
+        # Opt-in speed for memory: dequantizing costs more than the product
+        # itself, so an index within max_dense_mb is decoded to float32 once;
+        # otherwise rows stay mmapped and stream through in blocks per query
+        self._dense = None
+        if max_dense_mb and self.vectors.size * 4 <= max_dense_mb * 1024 * 1024:
+            self._dense = self._decode(0, len(self.vectors))
+
+    def count(self):
+        return len(self.vectors)
+
+    def _decode(self, start, stop):
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def _dot(self, queries):
+        """(rows, queries) inner products, dequantizing one block of rows at a time"""
+        if self._dense is not None:
+            return self._dense @ queries.T
+        scores = np.empty((len(self.vectors), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block = self._decode(start, start + BLOCK_ROWS)
+            scores[start:start + len(block)] = block @ queries.T
+        return scores
+
+    def _distances(self, queries):
+        dots = self._dot(queries)
+        if self.space == 'ip':
+            return 1.0 - dots
+        query_norms = np.linalg.norm(queries, axis=1)
+        if self.space == 'cosine':
+            denominator = np.outer(self.norms, query_norms)
+            return 1.0 - dots / np.where(denominator == 0, 1.0, denominator)
+        # Chroma's l2 is the squared Euclidean distance
+        return np.maximum(np.asarray(self.norms)[:, None] ** 2 - 2 * dots + query_norms ** 2, 0.0)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.info["dim"])
+        # Filtered-out rows never compete for the top k
+        allowed = np.flatnonzero(self.columns.mask(where)) if where else None
+        k = min(n_results, self.count() if allowed is None else len(allowed))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if k == 0:
+            for key in result:
+                result[key] = [[] for _ in queries]
+            return result
+
+        distances = self._distances(queries)
+        for column in distances.T:
+            candidates = np.arange(len(column)) if allowed is None else allowed
+            # Partial selection first, then order just the k winners
+            top = candidates[np.argpartition(column[candidates], k - 1)[:k]] if k < len(candidates) else candidates
+            top = top[np.argsort(column[top], kind='stable')]
+            ids, documents, metadatas = read_meta(self.meta, top)
+            result["ids"].append(ids)
+            result["documents"].append(documents)
+            result["metadatas"].append(metadatas)
+            result["distances"].append(column[top].tolist())
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Chroma collections to in-process NumPy indexes")
+    parser.add_argument('--chroma-path', default=CHROMA_PATH)
+    parser.add_argument('--output', default=INDEX_DIR)
+    parser.add_argument('--dtype', choices=['float16', 'int8'], default='float16')
+    parser.add_argument('--collections', nargs='+', default=COLLECTIONS)
+    parser.add_argument('--model', default="all-MiniLM-L6-v2", help="embedding model the vectors came from")
+    args = parser.parse_args()
+
+    import chromadb
+    client = chromadb.PersistentClient(path=args.chroma_path)
+    for name in args.collections:
+        collection = client.get_collection(name)
+        path = os.path.join(args.output, name)
+        count = export_collection(collection, path, args.dtype, model=args.model)
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print(f"✓ {name}: {count} vectors ({args.dtype}) -> {path} ({size / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Admission control for LLM generations: a concurrency limit plus a bounded wait queue"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't get an LLM slot; reason is 'queue_full' or 'timeout'"""
+
+    def __init__(self, reason):
+        super().__init__(f"LLM admission rejected: {reason}")
+        self.reason = reason
+
+
+class AdmissionController:
+    """At most `limit` generations run at once and at most `max_queue` wait behind them.
+
+    A request arriving to a full queue is rejected immediately; one that
+    waits past its timeout gives up. observer(seconds) is called with the
+    queue wait of every admitted request.
+    """
+
+    def __init__(self, limit=1, max_queue=4, timeout=30.0, observer=None):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.observer = observer
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._cond = threading.Condition()
+
+    def full(self):
+        """True when a new request would be turned away right now"""
+        with self._cond:
+            return self.active >= self.limit and self.waiting >= self.max_queue
+
+    def acquire(self, timeout=None):
+        """Wait for a slot; returns the seconds spent queued"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        with self._cond:
+            # Queued requests go first; a newcomer only jumps straight in when nobody waits
+            if self.active >= self.limit or self.waiting:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise AdmissionRejected("queue_full")
+                self.waiting += 1
+                try:
+                    deadline = started + timeout
+                    while self.active >= self.limit:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            # Pass on a wake-up this waiter may have swallowed
+                            self._cond.notify()
+                            raise AdmissionRejected("timeout")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+        waited = time.perf_counter() - started
+        if self.observer:
+            self.observer(waited)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        waited = self.acquire(timeout)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out
+            }
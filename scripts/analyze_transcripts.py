@@ -1,10 +1,15 @@
 # scripts/analyze_transcripts.py
-import pandas as pd
-from textblob import TextBlob
-from collections import Counter, defaultdict
+import argparse
 import json
 import os
 import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from textblob import TextBlob
+
+from corpus import CORPUS_PATH, CSV_PATH, format_timestamp, load_messages
 
 # Define themes using YOUR critical vocabulary
 THEMES = {
@@ -15,80 +20,145 @@ THEMES = {
     "ai-theory": ["machine", "agency", "chatbot", "authority", "LLM", "posthuman", "situated", "agential", "model","generation","sustainability"]
 }
 
-def classify_theme(text: str) -> str:
-    text_lower = text.lower()
-    matches = []
-    for theme, keywords in THEMES.items():
-        score = sum(1 for kw in keywords if kw in text_lower)
-        if score > 0:
-            matches.append((score, theme))
-    return max(matches, key=lambda x: x[0])[1] if matches else "other"
-
-df = pd.read_csv("assets/cleaned_chatgpt_history.csv")
-df = df.dropna(subset=["content"])
-df["content"] = df["content"].astype(str)
-
-# keep messages by role for separate + combined analysis
-all_messages = []
-
-for _, row in df.iterrows():
-    text = row["content"]
-    role = row["role"]
-    sentiment = TextBlob(text).sentiment.polarity
-    # Apply theme classification to BOTH user and assistant
-    theme = classify_theme(text)
-    
-    msg = {
-        "role": role,
-        "conversation_title": row["conversation_title"],
-        "timestamp": row["timestamp"],
-        "text": text,
-        "sentiment": round(sentiment, 3),
-        "theme": theme,
-        "word_count": len(text.split())
+STOPWORDS = set([
+    "the", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "a", "an", "is", "are", "was", "were",
+    "i", "you", "it", "this", "that", "they", "have", "has", "had", "do", "does", "did", "will", "can", "could", "should",
+    "would", "there", "what", "how", "when", "which", "like", "just", "from", "as", "not", "be", "been", "we", "me", "my",
+    "your", "about", "say", "said", "make", "get", "go", "know", "see", "think", "want", "need", "use", "work", "try", "ask"
+])
+
+WORD_PATTERN = re.compile(r"\b[a-zA-Z]{3,}\b")
+
+
+def compile_theme_matcher(themes):
+    """One regex that finds every keyword occurrence in a single pass.
+
+    The lookahead reports a match at every position, and longest-first
+    alternation picks the longest keyword starting there. Any keyword that
+    is a substring of a matched one is implied, so per-text results equal
+    checking each keyword with `in`.
+    """
+    keywords = sorted({kw for kws in themes.values() for kw in kws}, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(kw) for kw in keywords) + "))")
+    implied = {kw: {other for other in keywords if other in kw} for kw in keywords}
+    return pattern, implied
+
+
+THEME_PATTERN, IMPLIED_KEYWORDS = compile_theme_matcher(THEMES)
+
+
+def classify_themes(texts: pd.Series) -> pd.Series:
+    """Column-wise classify_theme: most distinct keyword hits wins, ties go to the earlier theme"""
+    hits = texts.str.lower().str.findall(THEME_PATTERN).explode().dropna()
+    keywords = hits.map(IMPLIED_KEYWORDS).explode()
+
+    keyword_theme = [(kw, theme) for theme, kws in THEMES.items() for kw in kws]
+    keyword_theme = pd.DataFrame(keyword_theme, columns=["keyword", "theme"])
+
+    # Score = number of distinct keywords of a theme present in the text
+    matched = pd.DataFrame({"row": keywords.index, "keyword": keywords.values}).drop_duplicates()
+    scores = (
+        matched.merge(keyword_theme, on="keyword")
+        .groupby(["row", "theme"]).size()
+        .unstack(fill_value=0)
+        .reindex(columns=list(THEMES), fill_value=0)
+    )
+
+    themes = pd.Series("other", index=texts.index)
+    if not scores.empty:
+        # idxmax returns the first maximal column, matching THEMES order tie-breaking
+        themes.loc[scores.index] = scores.idxmax(axis=1)
+    return themes
+
+
+def analyze_chunk(texts, roles):
+    """Sentiment and per-role word counts for one chunk (runs in a worker process)"""
+    sentiments = [round(TextBlob(text).sentiment.polarity, 3) for text in texts]
+
+    word_counts = {}
+    for text, role in zip(texts, roles):
+        counter = word_counts.setdefault(role, Counter())
+        counter.update(w for w in WORD_PATTERN.findall(text.lower()) if w not in STOPWORDS)
+    return sentiments, word_counts
+
+
+def summarize(df, word_counts, n=20):
+    samples_by_theme = {}
+    for theme, group in df.groupby("theme", sort=False):
+        samples_by_theme[theme] = [
+            {
+                "role": row.role,
+                "conversation_title": row.conversation_title,
+                "timestamp": format_timestamp(row.timestamp),
+                "text": row.content,
+                "sentiment": row.sentiment,
+                "theme": row.theme,
+                "word_count": len(row.content.split())
+            }
+            for row in group.head(2).itertuples()
+        ]
+
+    return {
+        "theme_distribution": {k: int(v) for k, v in df["theme"].value_counts(sort=False).items()},
+        "avg_sentiment": sum(df["sentiment"].tolist()) / len(df) if len(df) else 0,
+        "top_words": word_counts.most_common(n),
+        "samples_by_theme": samples_by_theme
     }
-    all_messages.append(msg)
-
-# Split for analysis
-user_msgs = [m for m in all_messages if m["role"] == "user"]
-assistant_msgs = [m for m in all_messages if m["role"] == "assistant"]
-
-# --- Aggregations ---
-def get_theme_counts(msgs):
-    return dict(Counter(m["theme"] for m in msgs))
-
-def get_top_words(msgs, n=20):
-
-    stopwords = set([
-        "the", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "a", "an", "is", "are", "was", "were",
-        "i", "you", "it", "this", "that", "they", "have", "has", "had", "do", "does", "did", "will", "can", "could", "should",
-        "would", "there", "what", "how", "when", "which", "like", "just", "from", "as", "not", "be", "been", "we", "me", "my",
-        "your", "about", "say", "said", "make", "get", "go", "know", "see", "think", "want", "need", "use", "work", "try", "ask"
-    ])
-
-    all_text = " ".join(m["text"].lower() for m in msgs)
-    words = re.findall(r"\b[a-zA-Z]{3,}\b", all_text)
-    filtered_words = [w for w in words if w not in stopwords]
-    return Counter(filtered_words).most_common(n)
-
-output = {
-    "metadata": {
-        "total_user": len(user_msgs),
-        "total_assistant": len(assistant_msgs),
-    },
-    "user": {
-        "theme_distribution": get_theme_counts(user_msgs),
-        "avg_sentiment": sum(m["sentiment"] for m in user_msgs) / len(user_msgs) if user_msgs else 0,
-        "top_words": get_top_words(user_msgs),
-        "samples_by_theme": {theme: [m for m in user_msgs if m["theme"] == theme][:2] for theme in set(m["theme"] for m in user_msgs)}
-    },
-    "assistant": {
-        "theme_distribution": get_theme_counts(assistant_msgs),
-        "avg_sentiment": sum(m["sentiment"] for m in assistant_msgs) / len(assistant_msgs) if assistant_msgs else 0,
-        "top_words": get_top_words(assistant_msgs),
-        "samples_by_theme": {theme: [m for m in assistant_msgs if m["theme"] == theme][:2] for theme in set(m["theme"] for m in assistant_msgs)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Theme, sentiment and vocabulary analysis of ChatGPT transcripts")
+    parser.add_argument('--input', default=CORPUS_PATH, help="Parquet corpus (falls back to the CSV if missing)")
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--output', default="assets/chatgpt-analysis.json")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="sentiment worker processes")
+    parser.add_argument('--chunk-size', type=int, default=500, help="messages per worker task")
+    args = parser.parse_args()
+
+    # Only the columns the analysis needs are read from the corpus
+    df = load_messages(["conversation_title", "timestamp", "role", "content"], path=args.input, csv_path=args.csv)
+    df = df.dropna(subset=["content"])
+    df["content"] = df["content"].astype(str)
+
+    # keep messages by role for separate + combined analysis
+    df["role"] = df["role"].astype(str)
+    df = df[df["role"].isin(["user", "assistant"])].reset_index(drop=True)
+
+    # Apply theme classification to BOTH user and assistant
+    df["theme"] = classify_themes(df["content"])
+
+    # Sentiment and word counts run per chunk across a process pool; counters
+    # are merged in chunk order so ties in most_common stay stable
+    starts = range(0, len(df), args.chunk_size)
+    sentiments = []
+    word_counts = {"user": Counter(), "assistant": Counter()}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = pool.map(
+            analyze_chunk,
+            [df["content"].iloc[i:i + args.chunk_size].tolist() for i in starts],
+            [df["role"].iloc[i:i + args.chunk_size].tolist() for i in starts]
+        )
+        for chunk_sentiments, chunk_counts in results:
+            sentiments.extend(chunk_sentiments)
+            for role, counter in chunk_counts.items():
+                word_counts[role].update(counter)
+    df["sentiment"] = sentiments
+
+    user_df = df[df["role"] == "user"]
+    assistant_df = df[df["role"] == "assistant"]
+
+    output = {
+        "metadata": {
+            "total_user": len(user_df),
+            "total_assistant": len(assistant_df),
+        },
+        "user": summarize(user_df, word_counts["user"]),
+        "assistant": summarize(assistant_df, word_counts["assistant"])
     }
-}
 
-with open("assets/chatgpt-analysis.json", "w") as f:
-    json.dump(output, f, indent=2)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,122 +1,138 @@
-from flask import Flask, request, jsonify, send_from_directory
-import chromadb
-from chromadb.utils import embedding_functions
-import ollama  # ADD THIS LINE
+from flask import Blueprint, Flask, Response, request, jsonify, send_from_directory, stream_with_context
 import os
+import sys
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 
-from PIL import Image
-import random
-import io
-import base64
-
-def create_collage_for_query(drawing_files, output_size=(700, 350), num_pieces=10):
-    """Create a unique collage from random pieces of drawings"""
-    
-    # Create blank canvas with slight off-white
-    collage = Image.new('RGB', output_size, (250, 248, 245))
-    
-    for _ in range(num_pieces):
-        # Pick random drawing
-        drawing_path = random.choice(drawing_files)
-        try:
-            img = Image.open(drawing_path).convert('RGBA')
-        except:
-            continue
-        
-        # Random crop size
-        crop_w = random.randint(80, 250)
-        crop_h = random.randint(80, 250)
-        
-        # Random position in source image
-        max_x = max(0, img.width - crop_w)
-        max_y = max(0, img.height - crop_h)
-        x = random.randint(0, max_x) if max_x > 0 else 0
-        y = random.randint(0, max_y) if max_y > 0 else 0
-        
-        # Crop piece
-        piece = img.crop((x, y, x + crop_w, y + crop_h))
-        
-        # Random rotation
-        angle = random.choice([0, 90, 180, 270, 45, -45])
-        piece = piece.rotate(angle, expand=True, fillcolor=(250, 248, 245, 0))
-        
-        # Random position on canvas
-        if piece.width < output_size[0] and piece.height < output_size[1]:
-            paste_x = random.randint(0, output_size[0] - piece.width)
-            paste_y = random.randint(0, output_size[1] - piece.height)
-            
-            # Apply transparency for layering
-            if piece.mode == 'RGBA':
-                alpha = piece.split()[3]
-                alpha = alpha.point(lambda p: int(p * random.uniform(0.6, 0.9)))
-                piece.putalpha(alpha)
-                collage.paste(piece, (paste_x, paste_y), piece)
-    
-    # Convert to base64 for embedding in HTML
-    buffer = io.BytesIO()
-    collage.save(buffer, format='JPEG', quality=85)
-    img_data = base64.b64encode(buffer.getvalue()).decode()
-    
-    return f"data:image/jpeg;base64,{img_data}"
-
+from admission import AdmissionController, AdmissionRejected
+from collage import CollagePool, CollageStore
+from metrics import Registry, StageTimer
+from response_cache import ResponseCache
 
+log = logging.getLogger("portrait.api")
 
 
 # Get the parent directory (portrait-of-inquiry root)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-app = Flask(__name__)
+# Shared RAG modules (retrieval engine, LLM client) live in rag/
+sys.path.insert(0, os.path.join(BASE_DIR, 'rag'))
+from query_engine import TranscriptFilter
+
+routes = Blueprint('routes', __name__)
 
-# Initialize Chroma client
+# chromadb, sentence-transformers and ollama are slow to import and load, so
+# they are filled in by load_backends() on a background thread
 chroma_path = os.path.join(BASE_DIR, 'rag', 'chroma_db')
-client = chromadb.PersistentClient(path=chroma_path)
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
+engine = None
+llm = None
+
+# Readiness of the backends: starting -> loading -> warming -> ready (or error)
+readiness = {"state": "starting", "error": None, "llm_warm": False, "load_seconds": None}
+backends_ready = threading.Event()
+
+# Per-stage latency histograms, served on /api/metrics
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    "rag_stage_seconds", "Time spent in each stage of a query", label="stage"
+)
+request_seconds = metrics.histogram(
+    "rag_request_seconds", "End-to-end query latency", label="route"
+)
+tokens_per_second = metrics.histogram(
+    "rag_llm_tokens_per_second", "LLM generation speed after the first token",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120)
 )
 
-# Get collections
-dialogic = client.get_collection("dialogic_inquiry", embedding_function=sentence_transformer_ef)
-intellectual = client.get_collection("intellectual_inquiry", embedding_function=sentence_transformer_ef)
+# Add a Server-Timing header (or stream event field) with each query's stage timings
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
 
-# API routes
-@app.route('/api/query', methods=['POST'])
-def query():
-    try:
-        print(f"=== QUERY ENDPOINT HIT ===")
-        
-        user_input = request.json['prompt']
-        n_results = request.json.get('n_results', 3)
-        
-        print(f"Query received: {user_input}")
-        
-        # Query both collections
-        dialogic_results = dialogic.query(
-            query_texts=[user_input], 
-            n_results=n_results
-        )
-        intellectual_results = intellectual.query(
-            query_texts=[user_input], 
-            n_results=n_results
-        )
-        
-        # Combine all sources into context
-        context_parts = []
-        
-        # Add dialogic sources
-        context_parts.append("=== From Your ChatGPT Conversations ===")
-        for i, doc in enumerate(dialogic_results['documents'][0]):
-            meta = dialogic_results['metadatas'][0][i]
-            context_parts.append(f"[Conversation: {meta['conversation_title']}]\n{doc}\n")
-        
-        # Add intellectual sources
-        context_parts.append("\n=== From Your Class Notes ===")
-        for i, doc in enumerate(intellectual_results['documents'][0]):
-            context_parts.append(f"[Note {i+1}]\n{doc}\n")
-        
-        full_context = "\n".join(context_parts)
-        
-        # Create the prompt for local LLM
-        system_prompt = """This is an art piece, a conceptual digital project that considers intellectual journey, 
+# Query routes may hold at most this many server threads at once, so a pile of
+# slow generations can't take the threads that serve health checks and assets
+QUERY_SLOTS = int(os.environ.get('QUERY_SLOTS', 8))
+query_slots = threading.BoundedSemaphore(QUERY_SLOTS)
+active_queries = {"count": 0}
+active_queries_lock = threading.Lock()
+
+# Generations share one CPU, so only a few run at once and a bounded number
+# wait behind them; when the queue is full (or a request's wait runs past
+# LLM_QUEUE_TIMEOUT) the visitor gets the retrieved sources without an answer,
+# or a 503 when LLM_OVERLOAD=reject
+LLM_OVERLOAD = os.environ.get('LLM_OVERLOAD', 'degrade')
+llm_queue_seconds = metrics.histogram(
+    "rag_llm_queue_wait_seconds", "Time admitted requests waited for an LLM slot"
+)
+llm_admission = AdmissionController(
+    limit=int(os.environ.get('LLM_CONCURRENCY', 1)),
+    max_queue=int(os.environ.get('LLM_QUEUE_SIZE', 4)),
+    timeout=float(os.environ.get('LLM_QUEUE_TIMEOUT', 30)),
+    observer=llm_queue_seconds.observe
+)
+
+# Batch requests (cache pre-warming, retrieval evaluation) are capped in size;
+# their generations wait up to BATCH_QUEUE_TIMEOUT for an LLM slot
+BATCH_MAX_PROMPTS = int(os.environ.get('BATCH_MAX_PROMPTS', 256))
+BATCH_QUEUE_TIMEOUT = float(os.environ.get('BATCH_QUEUE_TIMEOUT', 600))
+
+# VECTOR_BACKEND=numpy searches the memory-mapped export from rag/vector_index.py
+# (in VECTOR_INDEX_DIR) instead of Chroma
+VECTOR_BACKEND = os.environ.get('VECTOR_BACKEND', 'chroma')
+VECTOR_INDEX_DIR = os.environ.get('VECTOR_INDEX_DIR') or None
+# 0 keeps its vectors memory-mapped; a budget in MB decodes an index that fits
+# to float32 up front (faster queries, several times the file size in RAM)
+VECTOR_DENSE_MB = int(os.environ.get('VECTOR_DENSE_MB', 0))
+
+# Hybrid retrieval: BM25 (rag/lexical_index.py, built by the vectorize scripts)
+# fused with the vector ranking; off with HYBRID_RETRIEVAL=0 or when no index exists
+HYBRID_RETRIEVAL = os.environ.get('HYBRID_RETRIEVAL', '1') != '0'
+LEXICAL_INDEX_DIR = os.environ.get('LEXICAL_INDEX_DIR') or None
+FUSION_DEPTH = int(os.environ.get('FUSION_DEPTH', 20))
+
+# Retrieved sources are trimmed to this many (estimated) tokens of prompt context
+CONTEXT_TOKENS = int(os.environ.get('CONTEXT_TOKENS', 2048))
+
+# Drawings that collage fragments are cut from
+DRAWING_FILES = [
+    os.path.join(BASE_DIR, 'assets/atdrawings/8.12.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/9.18.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/9.25.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/10.9.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/10.16.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/10.23.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/11.6.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/11.13.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/11.20.25.jpeg'),
+    os.path.join(BASE_DIR, 'assets/atdrawings/12.11.25.jpeg')
+]
+
+# Ready-made collages; the worker also decodes the drawings once up front
+collage_seed = os.environ.get('COLLAGE_SEED')
+collage_pool = CollagePool(
+    DRAWING_FILES,
+    size=int(os.environ.get('COLLAGE_POOL_SIZE', 8)),
+    seed=int(collage_seed) if collage_seed else None,
+    image_format=os.environ.get('COLLAGE_FORMAT', 'JPEG').upper(),
+    observer=lambda stage, seconds: stage_seconds.observe(seconds, stage)
+)
+
+# Served collages are kept by content hash so the browser can cache them
+collage_store = CollageStore(max_items=int(os.environ.get('COLLAGE_STORE_SIZE', 64)))
+
+# Repeat questions skip retrieval and generation entirely; the semantic tier
+# (reuse answers for near-identical query embeddings) is opt-in
+semantic_threshold = os.environ.get('RESPONSE_CACHE_SEMANTIC_THRESHOLD')
+response_cache = ResponseCache(
+    max_items=int(os.environ.get('RESPONSE_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 3600)),
+    semantic_threshold=float(semantic_threshold) if semantic_threshold else None,
+    db_path=os.environ.get('RESPONSE_CACHE_DB') or None
+)
+
+SYSTEM_PROMPT = """This is an art piece, a conceptual digital project that considers intellectual journey, 
         and the way knowledge layers and combines with itself. It's called hallucinations of personal inquriy. Using RAG (Retrieval Augmented Generation) methods,
         the model combines personal and school ChatGPT conversation history, with class notes from Critical AI Studies and Data Bias courses.
         Above the query box to prompt, the user meets this dialogue: Here lies an open opportunity to query a proxy knowledge base of my mode of thought. 
@@ -137,7 +153,160 @@ def query():
 
         Do not simply list sources. Create a narrative synthesis that encourages further inquiry, especially non-text based."""
 
-        user_prompt = f"""Question: {user_input}
+# LLM_KEEP_ALIVE is an Ollama duration ('30m') or seconds (-1 keeps the model loaded forever)
+LLM_SETTINGS = {
+    'keep_alive': os.environ.get('LLM_KEEP_ALIVE', '30m'),
+    'timeout': float(os.environ.get('LLM_TIMEOUT', 120)),
+    # Seconds of idleness before the heartbeat reloads the model; 0 turns it off
+    'heartbeat_interval': float(os.environ.get('LLM_HEARTBEAT', 600))
+}
+
+LLM_OPTIONS = {
+    'num_predict': 300, 
+    'temperature': 0.7
+}
+
+metrics.gauge("rag_collage_pool_ready", "Encoded collages waiting in the pool",
+              lambda: collage_pool.stats()["ready"])
+metrics.counter("rag_collage_pool_requests_total", "Collage pool lookups by outcome",
+                lambda: {"hit": collage_pool.hits, "miss": collage_pool.misses}, label="outcome")
+metrics.gauge("rag_active_queries", "Query requests currently holding a slot",
+              lambda: active_queries["count"])
+metrics.gauge("rag_llm_active", "Generations currently running",
+              lambda: llm_admission.stats()["active"])
+metrics.gauge("rag_llm_queue_depth", "Requests waiting for an LLM slot",
+              lambda: llm_admission.stats()["waiting"])
+metrics.counter("rag_llm_admission_total", "LLM admission decisions by outcome",
+                lambda: {k: llm_admission.stats()[k] for k in ("admitted", "rejected", "timed_out")},
+                label="outcome")
+metrics.gauge("rag_response_cache_size", "Entries in the response cache",
+              lambda: response_cache.stats()["size"])
+metrics.counter("rag_response_cache_requests_total", "Response cache lookups by outcome",
+                lambda: {k: response_cache.stats()[k] for k in ("hits", "semantic_hits", "misses")},
+                label="outcome")
+
+
+def load_backends(warm_up=True):
+    """Open Chroma, load the embedding model and optionally warm up both models"""
+    global engine, llm
+    started = time.perf_counter()
+    try:
+        readiness["state"] = "loading"
+        from llm_client import LLMClient
+        from query_engine import RetrievalEngine
+
+        # Index, embedding model and both collections, opened once
+        engine = RetrievalEngine(
+            chroma_path, backend=VECTOR_BACKEND, index_dir=VECTOR_INDEX_DIR, dense_mb=VECTOR_DENSE_MB,
+            hybrid=HYBRID_RETRIEVAL, lexical_dir=LEXICAL_INDEX_DIR, fusion_depth=FUSION_DEPTH
+        )
+
+        # One client for the process: pooled connection, keep_alive on every call
+        llm = LLMClient(**LLM_SETTINGS)
+
+        if warm_up:
+            readiness["state"] = "warming"
+            # One dummy embedding pays the model-load cost before the first visitor
+            embed_query("warm up")
+            # Make Ollama load llama3.2 into memory; retrieval still works
+            # without the LLM, so a failure doesn't block readiness
+            readiness["llm_warm"] = llm.load()
+        llm.start_heartbeat()
+
+        readiness["state"] = "ready"
+        backends_ready.set()
+        counts = engine.counts()
+        log.info("Backends ready: %d dialogic, %d intellectual documents (%s retrieval)",
+                 counts["dialogic"], counts["intellectual"], "hybrid" if engine.hybrid else "vector")
+    except Exception as e:
+        readiness["state"] = "error"
+        readiness["error"] = str(e)
+        log.exception("Failed to load backends")
+    finally:
+        readiness["load_seconds"] = round(time.perf_counter() - started, 2)
+
+
+def requires_backends(view):
+    """Answer 503 instead of failing while models and collections are still loading"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not backends_ready.is_set():
+            return jsonify({"error": "Server is warming up, try again shortly", "state": readiness["state"]}), 503
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def acquire_query_slot():
+    if not query_slots.acquire(blocking=False):
+        return False
+    with active_queries_lock:
+        active_queries["count"] += 1
+    return True
+
+
+def release_query_slot():
+    with active_queries_lock:
+        active_queries["count"] -= 1
+    query_slots.release()
+
+
+def query_slot_busy():
+    """Shed load immediately rather than queueing behind slow generations"""
+    response = jsonify({"error": "Server is busy, try again shortly"})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+
+def llm_slot(started, timer):
+    """Admission for one generation; the queue deadline counts from when the request arrived"""
+    remaining = llm_admission.timeout - (time.perf_counter() - started)
+    waited = llm_admission.acquire(timeout=max(remaining, 0))
+    timer.record('llm_queue', waited)
+
+
+def llm_overloaded(reason):
+    log.warning("LLM admission rejected (%s): %s", reason, llm_admission.stats())
+    response = jsonify({"error": "The model is busy, try again shortly", "reason": reason})
+    response.headers['Retry-After'] = '10'
+    return response, 503
+
+
+def embed_query(user_input, timer=None):
+    """Embed the query once; both collections share the same MiniLM model"""
+    return engine.embed([user_input], timer)
+
+
+def record_generation_stats(final_chunk, timer, first_token_seconds=None):
+    """Record time-to-first-token and tokens/sec from Ollama's final response"""
+    if first_token_seconds is None and final_chunk.get('prompt_eval_duration') is not None:
+        # Non-streaming: model load plus prompt evaluation is what precedes the first token
+        first_token_seconds = ((final_chunk.get('load_duration') or 0) + final_chunk['prompt_eval_duration']) / 1e9
+    if first_token_seconds is not None:
+        timer.record('llm_first_token', first_token_seconds)
+
+    eval_count = final_chunk.get('eval_count')
+    eval_duration = final_chunk.get('eval_duration')
+    if eval_count and eval_duration:
+        tokens_per_second.observe(eval_count / (eval_duration / 1e9))
+
+
+def generate_answer(messages, timer):
+    """One non-streaming generation; the caller holds the LLM admission slot"""
+    log.debug("Generating response with local LLM...")
+    
+    # Generate with Ollama
+    with timer.stage('llm'):
+        response = llm.chat(messages, options=LLM_OPTIONS)
+    record_generation_stats(response, timer)
+    return response['message']['content']
+
+
+def build_messages(user_input, retrieval):
+    """Assemble the chat messages for the local LLM from retrieved sources"""
+    # Combine all sources into context, within the token budget
+    full_context = engine.build_context(retrieval, CONTEXT_TOKENS)
+
+    user_prompt = f"""Question: {user_input}
 
                 Relevant sources from my inquiry:
 
@@ -145,95 +314,396 @@ def query():
 
 Synthesize these sources to answer my question:"""
 
-        print("Generating response with local LLM...")
-        
-        # Generate with Ollama
-        response = ollama.chat(
-            model='llama3.2',
-            messages=[
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt}
-            ], 
-            options={
-                'num_predict': 300, 
-                'temperature': 0.7
-            }
-        )
+    return [
+        {'role': 'system', 'content': SYSTEM_PROMPT},
+        {'role': 'user', 'content': user_prompt}
+    ]
+
+
+def request_body():
+    """The request's JSON object, or {} when the body is missing or not a JSON object"""
+    body = request.get_json(silent=True)
+    return body if isinstance(body, dict) else {}
+
+
+def request_prompt(body):
+    """The "prompt" of a query body (ValueError when missing or blank)"""
+    prompt = body.get('prompt')
+    if not isinstance(prompt, str) or not prompt.strip():
+        raise ValueError("prompt must be a non-empty string")
+    return prompt
+
+
+def request_n_results(body):
+    """Sources per collection a query body asks for, 3 by default (ValueError outside 1-100)"""
+    n_results = body.get('n_results', 3)
+    if not isinstance(n_results, int) or isinstance(n_results, bool) or not 1 <= n_results <= 100:
+        raise ValueError("n_results must be an integer from 1 to 100")
+    return n_results
+
+
+def request_filters(body):
+    """Transcript filters from a request body's "filters" object (ValueError when malformed)"""
+    return TranscriptFilter.from_request((body or {}).get('filters'))
+
+
+def format_sources(sources):
+    """Retrieved sources as the content/metadata pairs the page expects"""
+    return [source.to_dict() for source in sources]
+
+
+def next_collage_url(timer=None):
+    """Take a ready collage from the pool and return the URL it is served at"""
+    timer = timer or StageTimer()
+    with timer.stage('collage'):
+        name = collage_store.put(collage_pool.get(), collage_pool.image_format)
+    return f"/api/collage/{name}"
+
+
+def finish_timing(timer, route, started, response=None):
+    """Record end-to-end latency and optionally attach a Server-Timing header"""
+    timer.record('total', time.perf_counter() - started)
+    request_seconds.observe(timer.durations['total'], route)
+    if SERVER_TIMING and response is not None:
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# API routes
+@routes.route('/api/query', methods=['POST'])
+@requires_backends
+def query():
+    body = request_body()
+    try:
+        user_input = request_prompt(body)
+        n_results = request_n_results(body)
+        filters = request_filters(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not acquire_query_slot():
+        return query_slot_busy()
+    started = time.perf_counter()
+    timer = StageTimer(stage_seconds)
+    try:
+        log.debug("=== QUERY ENDPOINT HIT ===")
+        log.info("Query received: %s", user_input)
+
+        with timer.stage('cache_lookup'):
+            cached, tier, query_embedding = response_cache.get(
+                user_input, n_results, embed=lambda: embed_query(user_input, timer), scope=filters.cache_scope()
+            )
+        if cached:
+            log.info("Response cache hit (%s)", tier)
+            response = jsonify(dict(cached, query=user_input, collage=next_collage_url(timer), cached=tier))
+            return finish_timing(timer, 'query', started, response)
         
-        generated_response = response['message']['content']
+        if query_embedding is None:
+            query_embedding = embed_query(user_input, timer)
+        retrieval = engine.retrieve(user_input, n_results, query_embedding, timer, filters=filters)
+
+        with timer.stage('prompt'):
+            messages = build_messages(user_input, retrieval)
+
+        # Sources are all a visitor gets when the model is overloaded
+        answer = {
+            "generated_answer": "",
+            # Include sources for transparency
+            "dialogic_sources": format_sources(retrieval.dialogic),
+            "intellectual_sources": format_sources(retrieval.intellectual)
+        }
+
+        try:
+            llm_slot(started, timer)
+        except AdmissionRejected as e:
+            if LLM_OVERLOAD == 'reject':
+                return llm_overloaded(e.reason)
+            log.warning("Serving sources only (%s)", e.reason)
+            response = jsonify(dict(answer, query=user_input, collage=next_collage_url(timer), degraded=e.reason))
+            return finish_timing(timer, 'query', started, response)
+
+        try:
+            generated_response = generate_answer(messages, timer)
+        finally:
+            llm_admission.release()
         
-        print(f"Generated response length: {len(generated_response)} chars")
+        log.debug("Generated response length: %d chars", len(generated_response))
         
-        # ============ ADD THIS SECTION HERE ============
         # Generate unique collage for this query
-        drawing_files = [
-            os.path.join(BASE_DIR, 'assets/atdrawings/8.12.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/9.18.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/9.25.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/10.9.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/10.16.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/10.23.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/11.6.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/11.13.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/11.20.25.jpeg'),
-            os.path.join(BASE_DIR, 'assets/atdrawings/12.11.25.jpeg')
-        ]
-        
-        collage_data = create_collage_for_query(drawing_files)
-        print("Generated unique collage for this query")
-        # ============ END NEW SECTION ============
+        collage_url = next_collage_url(timer)
         
+        # Cache the answer and sources; every response still gets a fresh collage
+        answer["generated_answer"] = generated_response
+        response_cache.put(user_input, n_results, answer, query_embedding, scope=filters.cache_scope())
+
         # Return both the generated answer and the sources
-        response_data = {
-            "query": user_input,
-            "generated_answer": generated_response,
-            "collage": collage_data,  # ← ADD THIS LINE
-            "dialogic_sources": [],
-            "intellectual_sources": []
-        }
-        
-        # Include sources for transparency
-        for i in range(len(dialogic_results['documents'][0])):
-            response_data["dialogic_sources"].append({
-                "content": dialogic_results['documents'][0][i],
-                "metadata": dialogic_results['metadatas'][0][i]
-            })
-        
-        for i in range(len(intellectual_results['documents'][0])):
-            response_data["intellectual_sources"].append({
-                "content": intellectual_results['documents'][0][i],
-                "metadata": intellectual_results['metadatas'][0][i]
-            })
+        response_data = dict(answer, query=user_input, collage=collage_url)
         
-        return jsonify(response_data)
+        with timer.stage('serialize'):
+            response = jsonify(response_data)
+        return finish_timing(timer, 'query', started, response)
     
     except Exception as e:
-        print(f"Error in query route: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in query route")
         return jsonify({"error": str(e)}), 500
-    
+    finally:
+        release_query_slot()
+
 
+@routes.route('/api/query/stream', methods=['POST'])
+@requires_backends
+def query_stream():
+    """Stream sources, then LLM tokens as they arrive, then the collage"""
+    log.debug("=== STREAM ENDPOINT HIT ===")
+
+    body = request_body()
+    try:
+        user_input = request_prompt(body)
+        n_results = request_n_results(body)
+        filters = request_filters(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not acquire_query_slot():
+        return query_slot_busy()
+    if LLM_OVERLOAD == 'reject' and llm_admission.full():
+        # Turn the visitor away before any work, while a status code can still be sent
+        release_query_slot()
+        return llm_overloaded("queue_full")
+
+    def generate():
+        started = time.perf_counter()
+        timer = StageTimer(stage_seconds)
+        try:
+            with timer.stage('cache_lookup'):
+                cached, tier, query_embedding = response_cache.get(
+                    user_input, n_results, embed=lambda: embed_query(user_input, timer), scope=filters.cache_scope()
+                )
+            if cached:
+                log.info("Response cache hit (%s)", tier)
+                yield sse_event('sources', {
+                    "query": user_input,
+                    "dialogic_sources": cached["dialogic_sources"],
+                    "intellectual_sources": cached["intellectual_sources"]
+                })
+                yield sse_event('token', {"content": cached["generated_answer"]})
+                yield sse_event('collage', {"collage": next_collage_url(timer)})
+                finish_timing(timer, 'stream', started)
+                yield sse_event('done', dict({"cached": tier}, **stream_timings(timer)))
+                return
+
+            if query_embedding is None:
+                query_embedding = embed_query(user_input, timer)
+            retrieval = engine.retrieve(user_input, n_results, query_embedding, timer, filters=filters)
+            answer = {
+                "generated_answer": "",
+                "dialogic_sources": format_sources(retrieval.dialogic),
+                "intellectual_sources": format_sources(retrieval.intellectual)
+            }
+
+            # Sources go out first so the page has something to show immediately
+            yield sse_event('sources', {
+                "query": user_input,
+                "dialogic_sources": answer["dialogic_sources"],
+                "intellectual_sources": answer["intellectual_sources"]
+            })
+
+            with timer.stage('prompt'):
+                messages = build_messages(user_input, retrieval)
+
+            try:
+                llm_slot(started, timer)
+            except AdmissionRejected as e:
+                if LLM_OVERLOAD == 'reject':
+                    raise
+                log.warning("Serving sources only (%s)", e.reason)
+                yield sse_event('degraded', {"reason": e.reason})
+                yield sse_event('collage', {"collage": next_collage_url(timer)})
+                finish_timing(timer, 'stream', started)
+                yield sse_event('done', stream_timings(timer))
+                return
+
+            try:
+                llm_started = time.perf_counter()
+                first_token_seconds = None
+                final_chunk = {}
+                stream = llm.chat(messages, options=LLM_OPTIONS, stream=True)
+                tokens = []
+                for chunk in stream:
+                    token = chunk['message']['content']
+                    if token:
+                        if first_token_seconds is None:
+                            first_token_seconds = time.perf_counter() - llm_started
+                        tokens.append(token)
+                        yield sse_event('token', {"content": token})
+                    final_chunk = chunk
+            finally:
+                llm_admission.release()
+            timer.record('llm', time.perf_counter() - llm_started)
+            record_generation_stats(final_chunk, timer, first_token_seconds)
+
+            # Only complete generations are cached
+            answer["generated_answer"] = "".join(tokens)
+            response_cache.put(user_input, n_results, answer, query_embedding, scope=filters.cache_scope())
+
+            yield sse_event('collage', {"collage": next_collage_url(timer)})
+            finish_timing(timer, 'stream', started)
+            yield sse_event('done', stream_timings(timer))
+
+        except Exception as e:
+            log.exception("Error in stream route")
+            yield sse_event('error', {"error": str(e)})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        # Keep proxies from buffering the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # The slot is held until the server closes the stream, even if the client leaves early
+    response.call_on_close(release_query_slot)
+    return response
+
+
+@routes.route('/api/query/batch', methods=['POST'])
+@requires_backends
+def query_batch():
+    """Retrieve for many prompts with one embedding batch and one search per collection.
+
+    With "generate": true each answer is also generated (at most "parallel" at
+    a time) and stored in the response cache, which is how the cache gets
+    pre-warmed; prompts already cached are not generated again.
+    """
+    body = request_body()
+    prompts = body.get('prompts')
+    if not isinstance(prompts, list) or not all(isinstance(p, str) and p.strip() for p in prompts):
+        return jsonify({"error": "prompts must be a list of non-empty strings"}), 400
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        return jsonify({"error": f"at most {BATCH_MAX_PROMPTS} prompts per batch"}), 400
+    try:
+        n_results = request_n_results(body)
+        filters = request_filters(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    generate = bool(body.get('generate', False))
+    parallel = body.get('parallel', 1)
+    if not isinstance(parallel, int) or isinstance(parallel, bool):
+        return jsonify({"error": "parallel must be an integer"}), 400
+    # More generations than LLM slots would only queue inside the batch
+    parallel = max(1, min(parallel, llm_admission.limit))
+    scope = filters.cache_scope()
+
+    if not acquire_query_slot():
+        return query_slot_busy()
+    started = time.perf_counter()
+    timer = StageTimer(stage_seconds)
+    try:
+        log.info("Batch of %d prompts (generate=%s)", len(prompts), generate)
+        retrievals = engine.retrieve_many(prompts, n_results, timer=timer, filters=filters)
+        # Ids and distances make retrieval quality measurable offline
+        results = [retrieval.to_dict(scores=True) for retrieval in retrievals]
+
+        def answer(index):
+            retrieval, result = retrievals[index], results[index]
+            try:
+                cached, tier, _ = response_cache.get(retrieval.query, n_results, scope=scope)
+                if cached:
+                    result.update(generated_answer=cached["generated_answer"], cached=tier)
+                    return
+                messages = build_messages(retrieval.query, retrieval)
+                llm_admission.acquire(timeout=BATCH_QUEUE_TIMEOUT)
+                try:
+                    result["generated_answer"] = generate_answer(messages, timer)
+                finally:
+                    llm_admission.release()
+                response_cache.put(retrieval.query, n_results, {
+                    "generated_answer": result["generated_answer"],
+                    "dialogic_sources": format_sources(retrieval.dialogic),
+                    "intellectual_sources": format_sources(retrieval.intellectual)
+                }, retrieval.embedding, scope=scope)
+            except Exception as e:
+                # One failed prompt shouldn't sink the rest of the batch
+                log.warning("Batch generation failed for %r: %s", retrieval.query, e)
+                result["error"] = str(e)
+
+        if generate:
+            with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="batch-llm") as pool:
+                list(pool.map(answer, range(len(retrievals))))
+
+        with timer.stage('serialize'):
+            response = jsonify({"count": len(results), "results": results})
+        return finish_timing(timer, 'batch', started, response)
+
+    except Exception as e:
+        log.exception("Error in batch route")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        release_query_slot()
+
+
+def stream_timings(timer):
+    """Headers are gone by the end of a stream, so timings ride on the done event"""
+    return {"server_timing": timer.server_timing()} if SERVER_TIMING else {}
     
 
-@app.route('/api/health', methods=['GET'])
+@routes.route('/api/collage/<name>', methods=['GET'])
+def collage_image(name):
+    item = collage_store.get(name)
+    if item is None:
+        return "Collage not found", 404
+
+    data, mimetype = item
+    response = Response(data, mimetype=mimetype)
+    # Names are content hashes, so a given URL never changes
+    response.set_etag(name.split('.')[0])
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
+
+@routes.route('/api/health', methods=['GET'])
 def health():
-    print("=== HEALTH ENDPOINT HIT ===")
-    return jsonify({
+    """Liveness probe: answers as soon as the server is up, whatever the backends are doing"""
+    log.debug("=== HEALTH ENDPOINT HIT ===")
+    body = {
         "status": "ok",
-        "dialogic_count": dialogic.count(),
-        "intellectual_count": intellectual.count()
-    })
+        "readiness": readiness,
+        "collage_pool": collage_pool.stats(),
+        "response_cache": response_cache.stats(),
+        "llm_admission": llm_admission.stats()
+    }
+    if backends_ready.is_set():
+        body["llm"] = llm.stats()
+        counts = engine.counts()
+        body["dialogic_count"] = counts["dialogic"]
+        body["intellectual_count"] = counts["intellectual"]
+        body["hybrid_retrieval"] = engine.hybrid
+    return jsonify(body)
+
+
+@routes.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once models and collections are loaded, 503 until then"""
+    return jsonify(readiness), 200 if backends_ready.is_set() else 503
+
+
+@routes.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency histograms and pool/cache counters in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # Static file routes
-@app.route('/')
+@routes.route('/')
 def index():
-    print("=== ROOT / HIT ===")
-    return send_from_directory(BASE_DIR, 'mainpage.html')
+    log.debug("=== ROOT / HIT ===")
+    # The page itself is always revalidated so a redeploy shows up immediately
+    return send_from_directory(BASE_DIR, 'mainpage.html', max_age=0)
 
-@app.route('/<path:path>')
+@routes.route('/<path:path>')
 def serve_static(path):
-    print(f"=== STATIC FILE REQUEST: {path} ===")
+    log.debug("=== STATIC FILE REQUEST: %s ===", path)
     # Block api routes from being served as static
     if path.startswith('api'):
         return "Not found", 404
@@ -243,13 +713,39 @@ def serve_static(path):
     except:
         return "File not found", 404
 
+
+def create_app(load=True, warm_up=True, static_max_age=None):
+    """Build the Flask app; backends load in the background so startup is immediate
+
+    static_max_age (seconds) sets Cache-Control on static files; conditional
+    requests are answered with 304 either way.
+    """
+    app = Flask(__name__)
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = static_max_age
+    app.register_blueprint(routes)
+    if load:
+        collage_pool.start()
+        threading.Thread(target=load_backends, args=(warm_up,), name="load-backends", daemon=True).start()
+    return app
+
+
+def configure_logging():
+    """LOG_LEVEL picks the level (default INFO); LOG_LEVEL=OFF silences logging entirely"""
+    level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    if level == 'OFF':
+        logging.disable(logging.CRITICAL)
+        return
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
 if __name__ == '__main__':
-    print("Starting RAG API server with static file serving...")
-    print(f"Base directory: {BASE_DIR}")
-    print(f"Dialogic inquiry: {dialogic.count()} documents")
-    print(f"Intellectual inquiry: {intellectual.count()} documents")
-    print("Access your site at: http://localhost:5000")
-    print("\nRegistered routes:")
-    for rule in app.url_map.iter_rules():
-        print(f"  {rule}")
-    app.run(host='127.0.0.1', port=5001, debug=True)
\ No newline at end of file
+    configure_logging()
+    # With the debug reloader, only the serving child process should load models
+    app = create_app(load=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
+    log.info("Starting RAG API server with static file serving...")
+    log.info("Base directory: %s", BASE_DIR)
+    log.info("Models and collections are loading in the background (see /api/ready)")
+    log.info("This is the development server; use scripts/serve.py in production")
+    log.info("Access your site at: http://localhost:5000")
+    log.debug("Registered routes: %s", ", ".join(str(rule) for rule in app.url_map.iter_rules()))
+    app.run(host='127.0.0.1', port=5001, debug=True)
@@ -0,0 +1,119 @@
+"""Run a prompt set through the RAG pipeline in batches
+
+Pre-warm a running server's response cache before an exhibition opens:
+
+    python scripts/batch_query.py prompts.txt --generate
+
+or evaluate retrieval alone, in-process and without a server:
+
+    python scripts/batch_query.py prompts.txt --local --output assets/retrieval_eval.json
+
+Prompts are read one per line (blank lines and # comments skipped) or as a JSON list.
+--role, --since, --until, --conversation and --per-conversation restrict the
+transcript sources the same way the API's "filters" object does.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_prompts(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith('#')]
+
+
+def post_batch(url, prompts, n_results, generate, parallel, timeout, filters=None):
+    payload = json.dumps({
+        "prompts": prompts,
+        "n_results": n_results,
+        "generate": generate,
+        "parallel": parallel,
+        "filters": filters or {}
+    }).encode('utf-8')
+    req = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.load(response)["results"]
+
+
+def local_batch(engine, prompts, n_results, filters=None):
+    """Retrieval only, straight from the index"""
+    return [retrieval.to_dict(scores=True) for retrieval in engine.retrieve_many(prompts, n_results, filters=filters)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch retrieval and cache pre-warming for the RAG API")
+    parser.add_argument('prompts', help="text file with one prompt per line, or a JSON list")
+    parser.add_argument('--url', default='http://127.0.0.1:5001/api/query/batch')
+    parser.add_argument('--n-results', type=int, default=3)
+    parser.add_argument('--generate', action='store_true', help="also generate answers (fills the server's response cache)")
+    parser.add_argument('--parallel', type=int, default=1, help="generations in flight at once (capped by the server)")
+    parser.add_argument('--batch-size', type=int, default=32, help="prompts per request")
+    parser.add_argument('--timeout', type=float, default=3600, help="seconds to wait for one batch request")
+    parser.add_argument('--local', action='store_true', help="retrieve in-process instead of calling the server")
+    parser.add_argument('--output', help="write all results to this JSON file")
+    parser.add_argument('--role', nargs='+', help="only transcript chunks with a turn by one of these roles (user, assistant)")
+    parser.add_argument('--since', help="only transcript messages from this date/datetime on")
+    parser.add_argument('--until', help="only transcript messages up to this date/datetime")
+    parser.add_argument('--conversation', nargs='+', help="only these conversations (conversation_id or title)")
+    parser.add_argument('--per-conversation', type=int, help="at most this many sources per conversation")
+    args = parser.parse_args()
+
+    filters = {
+        key: value for key, value in {
+            "role": args.role,
+            "since": args.since,
+            "until": args.until,
+            "conversation": args.conversation,
+            "per_conversation": args.per_conversation
+        }.items() if value is not None
+    }
+
+    prompts = load_prompts(args.prompts)
+    print(f"{len(prompts)} prompts")
+
+    engine = None
+    if args.local:
+        if args.generate:
+            parser.error("--generate needs the server (its response cache is what gets warmed)")
+        sys.path.insert(0, os.path.join(BASE_DIR, 'rag'))
+        from query_engine import RetrievalEngine, TranscriptFilter
+        engine = RetrievalEngine()
+        try:
+            local_filters = TranscriptFilter.from_request(filters)
+        except ValueError as e:
+            parser.error(str(e))
+
+    results = []
+    started = time.perf_counter()
+    for i in range(0, len(prompts), args.batch_size):
+        batch = prompts[i:i + args.batch_size]
+        batch_started = time.perf_counter()
+        if engine is not None:
+            results.extend(local_batch(engine, batch, args.n_results, local_filters))
+        else:
+            results.extend(post_batch(args.url, batch, args.n_results, args.generate, args.parallel, args.timeout, filters))
+        print(f"  {i + len(batch)}/{len(prompts)} done ({time.perf_counter() - batch_started:.1f}s)")
+
+    elapsed = time.perf_counter() - started
+    errors = [r for r in results if r.get("error")]
+    cached = sum(1 for r in results if r.get("cached"))
+    print(f"✓ {len(results)} prompts in {elapsed:.1f}s ({len(results) / elapsed:.1f}/s)")
+    if args.generate:
+        print(f"  {len(results) - cached - len(errors)} generated, {cached} already cached, {len(errors)} failed")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+"""Latency and throughput benchmarks for each stage of the RAG pipeline
+
+    python scripts/benchmark.py --output assets/benchmarks/$(git rev-parse --short HEAD).json
+    python scripts/benchmark.py --only collage,json --baseline assets/benchmarks/previous.json
+
+Stages: embedding (single vs batched, per backend), Chroma queries vs n_results and vs
+collection size, collage rendering/encoding, JSON serialization, and the
+full /api/query under concurrent load against a local stub Ollama server,
+so end-to-end numbers don't depend on the machine's LLM. Every timing is
+reported as p50/p95/p99 plus throughput, and written to a JSON file that a
+later run can compare itself against with --baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'rag'))
+
+SECTIONS = ['embed', 'chroma', 'chroma_scaling', 'collage', 'json', 'query_load']
+
+QUERIES = [
+    "what is situated knowledge?",
+    "how does drawing help me think?",
+    "data bias in machine learning datasets",
+    "posthumanism and agency",
+    "how do I structure a python script for a dataset",
+    "the body as a site of knowledge",
+    "who decides what counts as authority in AI?",
+    "sustainability of large language models",
+    "pedagogy and learning by making",
+    "identity, values and subjectivity",
+    "json parsing errors in my loop",
+    "feminist critiques of data visualization",
+    "touch, paper and material practice",
+    "what does it mean for a chatbot to be an agent?",
+    "reading notes on critical AI studies",
+    "therapeutic art and the senses"
+]
+
+
+def summarize(samples, items=1):
+    """Percentiles (ms) of per-call durations, and items processed per second"""
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        "n": int(samples.size),
+        "mean_ms": round(float(samples.mean()) * 1000, 3),
+        "p50_ms": round(float(np.percentile(samples, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(samples, 99)) * 1000, 3),
+        "throughput_per_s": round(items * samples.size / float(samples.sum()), 2) if samples.sum() else None
+    }
+
+
+def time_calls(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def sample_texts(n=256):
+    """Transcript messages as realistic documents; falls back to the query list"""
+    try:
+        from corpus import iter_message_batches
+        texts = []
+        for df in iter_message_batches(columns=['content'], batch_size=2000):
+            texts.extend(str(t)[:1000] for t in df['content'].dropna())
+            if len(texts) >= n:
+                break
+        if texts:
+            return texts[:n]
+    except (OSError, ImportError):
+        pass
+    return [QUERIES[i % len(QUERIES)] for i in range(n)]
+
+
+def bench_embed(args):
+    from embeddings import load_embedding_function
+    texts = sample_texts()
+    results = {}
+    for backend in args.embedding_backends:
+        try:
+            model = load_embedding_function(backend)
+        except (ImportError, OSError) as e:
+            print(f"  {backend} skipped: {e}")
+            results[f"{backend}/skipped"] = str(e)
+            continue
+        results[f"{backend}/query_single"] = summarize(time_calls(
+            lambda: model.encode([random.choice(QUERIES)]), args.repeat
+        ))
+        for batch_size in (8, 32, 128):
+            batch = texts[:batch_size]
+            results[f"{backend}/documents_batch_{batch_size}"] = summarize(
+                time_calls(lambda: model.encode(batch, batch_size=batch_size), max(3, args.repeat // 5)),
+                items=batch_size
+            )
+
+    # Speedup of every other backend over the first one, by median latency
+    reference = args.embedding_backends[0]
+    for name in [n for n in results if n.startswith(reference + '/') and isinstance(results[n], dict)]:
+        stage = name.split('/', 1)[1]
+        for backend in args.embedding_backends[1:]:
+            other = results.get(f"{backend}/{stage}")
+            if isinstance(other, dict) and other["p50_ms"]:
+                results[f"{backend}/{stage}_speedup"] = round(results[name]["p50_ms"] / other["p50_ms"], 2)
+    return results
+
+
+def bench_chroma(args):
+    from query_engine import RetrievalEngine
+    engine = RetrievalEngine(backend=args.backend)
+    embeddings = engine.embed(QUERIES)
+    results = {"backend": args.backend, "collection_sizes": engine.counts()}
+    for name, collection in (("dialogic", engine.dialogic), ("intellectual", engine.intellectual)):
+        for k in args.n_results:
+            samples = []
+            for i in range(args.repeat):
+                started = time.perf_counter()
+                collection.query(query_embeddings=[embeddings[i % len(embeddings)]], n_results=k)
+                samples.append(time.perf_counter() - started)
+            results[f"{name}_k{k}"] = summarize(samples)
+    # Both collections for a whole query set in one multi-query call each
+    results["retrieve_many_16"] = summarize(
+        time_calls(lambda: engine.retrieve_many(QUERIES, 3, query_embeddings=embeddings), max(3, args.repeat // 5)),
+        items=len(QUERIES)
+    )
+    return results
+
+
+def bench_chroma_scaling(args):
+    """Query latency against synthetic collections of growing size"""
+    import chromadb
+    rng = np.random.default_rng(0)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=tmp)
+        queries = rng.standard_normal((64, 384)).astype(np.float32)
+        for size in args.sizes:
+            collection = client.create_collection(f"bench_{size}")
+            vectors = rng.standard_normal((size, 384)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            for start in range(0, size, 4000):
+                chunk = vectors[start:start + 4000]
+                collection.add(
+                    ids=[f"v{start + i}" for i in range(len(chunk))],
+                    embeddings=chunk.tolist(),
+                    documents=["x"] * len(chunk)
+                )
+            samples = []
+            for i in range(args.repeat):
+                started = time.perf_counter()
+                collection.query(query_embeddings=[queries[i % len(queries)].tolist()], n_results=5)
+                samples.append(time.perf_counter() - started)
+            results[f"size_{size}_k5"] = summarize(samples)
+            client.delete_collection(f"bench_{size}")
+    return results
+
+
+def bench_collage(args):
+    from collage import DrawingCache, encode_collage, render_collage
+    from extract_art_colors import DRAWINGS_DIR, discover_drawings
+    drawings = [os.path.join(BASE_DIR, DRAWINGS_DIR, f) for f in discover_drawings(os.path.join(BASE_DIR, DRAWINGS_DIR))]
+    cache = DrawingCache()
+    started = time.perf_counter()
+    cache.preload(drawings)
+    results = {"preload_seconds": round(time.perf_counter() - started, 3), "drawings": len(drawings)}
+
+    rng = random.Random(0)
+    results["render"] = summarize(time_calls(lambda: render_collage(drawings, cache=cache, rng=rng), args.repeat))
+    collage = render_collage(drawings, cache=cache, rng=rng)
+    for image_format in ("JPEG", "WEBP"):
+        results[f"encode_{image_format.lower()}"] = summarize(
+            time_calls(lambda: encode_collage(collage, image_format), args.repeat)
+        )
+        results[f"encoded_bytes_{image_format.lower()}"] = len(encode_collage(collage, image_format))
+    return results
+
+
+def bench_json(args):
+    """Serializing a /api/query response body, with json.dumps and with Flask's jsonify"""
+    from flask import Flask, jsonify
+    app = Flask(__name__)
+    texts = sample_texts(64)
+    metadata = {"timestamp": "2025-10-09 14:03:22.000000", "role": "user", "conversation_title": "Situated knowledges"}
+    results = {}
+    for k in (3, 10, 25):
+        body = {
+            "query": QUERIES[0],
+            "generated_answer": " ".join(QUERIES) * 4,
+            "dialogic_sources": [{"content": texts[i % len(texts)], "metadata": metadata} for i in range(k)],
+            "intellectual_sources": [{"content": texts[-i - 1], "metadata": {"source": "class_notes", "chunk_id": i}} for i in range(k)],
+            "collage": "/api/collage/0123456789abcdef0123456789abcdef.jpg"
+        }
+        results[f"dumps_k{k}"] = summarize(time_calls(lambda: json.dumps(body), args.repeat))
+        with app.app_context():
+            results[f"jsonify_k{k}"] = summarize(time_calls(lambda: jsonify(body), args.repeat))
+        results[f"bytes_k{k}"] = len(json.dumps(body))
+    return results
+
+
+def start_local_server(args):
+    """The real app (Chroma, embeddings, collages) talking to a stub Ollama, under waitress"""
+    from stub_ollama import start_stub
+    from waitress import serve
+    stub = start_stub(port=args.stub_port, prompt_delay=args.stub_prompt_delay, tokens_per_second=args.stub_tokens_per_second)
+    # Must be in place before api is imported: it reads its settings at import time
+    os.environ['OLLAMA_HOST'] = f"http://127.0.0.1:{args.stub_port}"
+    os.environ.setdefault('LLM_HEARTBEAT', '0')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import api
+    api.configure_logging()
+    app = api.create_app()
+    while api.readiness["state"] not in ("ready", "error"):
+        time.sleep(0.2)
+    if api.readiness["state"] == "error":
+        raise RuntimeError(f"Backends did not load: {api.readiness['error']}")
+    threads = api.QUERY_SLOTS + 4
+    threading.Thread(
+        target=serve, args=(app,), kwargs={"host": "127.0.0.1", "port": args.port, "threads": threads},
+        name="bench-server", daemon=True
+    ).start()
+    url = f"http://127.0.0.1:{args.port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + "/api/ready", timeout=1)
+            break
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    return url, stub
+
+
+def post_query(url, prompt, timeout=120):
+    payload = json.dumps({"prompt": prompt, "n_results": 3}).encode('utf-8')
+    req = urllib.request.Request(url + "/api/query", data=payload, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            body = json.load(response)
+            outcome = "degraded" if body.get("degraded") else ("cached" if body.get("cached") else "ok")
+    except urllib.error.HTTPError as e:
+        outcome = str(e.code)
+    except (urllib.error.URLError, TimeoutError) as e:
+        outcome = type(e).__name__
+    return time.perf_counter() - started, outcome
+
+
+def bench_query_load(args):
+    url, stub = (args.url, None) if args.url else start_local_server(args)
+    results = {"url": url}
+    run = 0
+    for concurrency in args.concurrency:
+        run += 1
+        # Distinct prompts so every request misses the response cache
+        prompts = [f"{QUERIES[i % len(QUERIES)]} ({run}.{i})" for i in range(max(args.requests, concurrency))]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(lambda p: post_query(url, p), prompts))
+        wall = time.perf_counter() - started
+        latencies = [seconds for seconds, outcome in outcomes if outcome in ("ok", "cached", "degraded")]
+        summary = summarize(latencies) if latencies else {"n": 0}
+        summary["throughput_per_s"] = round(len(latencies) / wall, 2)
+        summary["outcomes"] = dict(Counter(outcome for _, outcome in outcomes))
+        results[f"concurrency_{concurrency}"] = summary
+        print(f"  concurrency {concurrency}: p50 {summary.get('p50_ms')} ms, "
+              f"{summary['throughput_per_s']}/s, {summary['outcomes']}")
+    if stub is not None:
+        stub.shutdown()
+    return results
+
+
+BENCHMARKS = {
+    'embed': bench_embed,
+    'chroma': bench_chroma,
+    'chroma_scaling': bench_chroma_scaling,
+    'collage': bench_collage,
+    'json': bench_json,
+    'query_load': bench_query_load
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print p50/p95 of every timing next to the baseline run's"""
+    print(f"\nCompared with {baseline['meta'].get('git_revision')} ({baseline['meta'].get('timestamp')}):")
+    for section, timings in results.items():
+        for name, current in timings.items():
+            previous = baseline.get('results', {}).get(section, {}).get(name)
+            if not isinstance(current, dict) or not isinstance(previous, dict) or 'p50_ms' not in current or 'p50_ms' not in previous:
+                continue
+            ratio = current['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else float('nan')
+            print(f"  {section}/{name}: p50 {previous['p50_ms']} -> {current['p50_ms']} ms ({ratio:.2f}x), "
+                  f"p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline stage by stage")
+    parser.add_argument('--only', help=f"comma-separated sections ({', '.join(SECTIONS)})")
+    parser.add_argument('--repeat', type=int, default=50, help="timed calls per measurement")
+    parser.add_argument('--n-results', type=int, nargs='+', default=[1, 3, 5, 10, 25])
+    parser.add_argument('--backend', choices=['chroma', 'numpy'], default='chroma',
+                        help="retrieval backend for the chroma section")
+    parser.add_argument('--embedding-backends', nargs='+', choices=['torch', 'onnx', 'onnx-fp32'], default=['torch', 'onnx'],
+                        help="embedding backends for the embed section; speedups are relative to the first")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help="synthetic collection sizes for chroma_scaling")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests', type=int, default=32, help="requests per concurrency level")
+    parser.add_argument('--url', help="load-test an already running server instead of starting one")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--stub-port', type=int, default=11435)
+    parser.add_argument('--stub-prompt-delay', type=float, default=0.2)
+    parser.add_argument('--stub-tokens-per-second', type=float, default=40.0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    sections = args.only.split(',') if args.only else SECTIONS
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for section in sections:
+        print(f"Running {section}...")
+        started = time.perf_counter()
+        try:
+            results[section] = BENCHMARKS[section](args)
+        except ImportError as e:
+            # A missing optional backend shouldn't stop the other sections
+            print(f"  skipped: {e}")
+            results[section] = {"skipped": str(e)}
+            continue
+        except Exception as e:
+            print(f"  failed: {e}")
+            results[section] = {"error": str(e)}
+            continue
+        print(f"  done in {time.perf_counter() - started:.1f}s")
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"✓ Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Token-aware chunking shared by the vectorize scripts
+
+Sizes are counted with the embedding model's own tokenizer, so every chunk
+fits the model's window (256 wordpieces for all-MiniLM-L6-v2, less the
+[CLS]/[SEP] pair) and nothing is silently truncated:
+
+- short adjacent units in the same group (turns of one conversation,
+  paragraphs of the notes) are merged into one chunk;
+- a unit longer than the window is split into overlapping windows.
+"""
+from dataclasses import dataclass
+
+# Tokens the model adds around every input ([CLS] ... [SEP])
+SPECIAL_TOKENS = 2
+
+
+@dataclass
+class Unit:
+    """One piece of source text: a transcript message or a notes paragraph"""
+    group: str       # units are only merged within a group (e.g. a conversation)
+    text: str
+    payload: object  # handed back on the chunk, e.g. (message ID, metadata)
+    label: str = None  # e.g. the role; prefixed to each part when a chunk mixes labels
+
+
+@dataclass
+class Chunk:
+    text: str
+    units: list             # the Units the text came from, in order
+    window: int = None      # for a split unit: this window's index,
+    windows: int = None     # how many windows it was split into,
+    span: tuple = None      # and the (start, end) characters of the unit's text covered
+    tokens: int = 0
+
+
+class TokenChunker:
+    """Groups units into chunks of at most max_tokens model tokens.
+
+    token_spans is an embedder's token_spans(): (start, end) character
+    offsets of each text's tokens. Units are merged while the chunk so far or
+    the next unit has fewer than merge_below tokens (merge_below=None packs
+    greedily, as the notes want); a unit over max_tokens becomes windows of
+    max_tokens that overlap by overlap tokens. Every window is kept unless
+    max_windows caps them (None or 0: no cap); text past the cap is in
+    neither the vector nor the BM25 index.
+    """
+
+    def __init__(self, token_spans, max_tokens=254, overlap=32, merge_below=48, max_windows=None, batch_size=512):
+        if not 0 <= overlap < max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")
+        self.token_spans = token_spans
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.merge_below = max_tokens if merge_below is None else merge_below
+        self.max_windows = max_windows
+        self.batch_size = batch_size
+
+    @classmethod
+    def for_embedder(cls, embedder, max_tokens=None, **kwargs):
+        """Sized to the embedder's sequence length unless max_tokens says otherwise"""
+        return cls(embedder.token_spans, max_tokens or embedder.max_length - SPECIAL_TOKENS, **kwargs)
+
+    def _measured(self, units):
+        """(unit, token spans) pairs, tokenizing batch_size units per call"""
+        batch = []
+        for unit in units:
+            batch.append(unit)
+            if len(batch) >= self.batch_size:
+                yield from zip(batch, self.token_spans([u.text for u in batch]))
+                batch = []
+        if batch:
+            yield from zip(batch, self.token_spans([u.text for u in batch]))
+
+    @staticmethod
+    def _starts_word(text, spans, i):
+        """False for a wordpiece continuing the previous token's word (e.g. ##ing)"""
+        if i == 0 or i >= len(spans) or spans[i][0] > spans[i - 1][1]:
+            return True
+        return not (text[spans[i][0]].isalnum() and text[spans[i - 1][1] - 1].isalnum())
+
+    def _windows(self, unit, spans):
+        # Windows start and end on word boundaries: cut mid-word, a slice
+        # re-tokenizes into more pieces than it had in context
+        bounds, first = [], 0
+        while True:
+            last = min(first + self.max_tokens, len(spans))
+            while last < len(spans) and last > first + 1 and not self._starts_word(unit.text, spans, last):
+                last -= 1
+            bounds.append((first, last))
+            if last >= len(spans) or (self.max_windows and len(bounds) >= self.max_windows):
+                break
+            following = max(last - self.overlap, first + 1)
+            while following > first + 1 and not self._starts_word(unit.text, spans, following):
+                following -= 1
+            first = following
+
+        for index, (first, last) in enumerate(bounds):
+            start, end = spans[first][0], spans[last - 1][1]
+            yield Chunk(
+                text=unit.text[start:end], units=[unit], window=index, windows=len(bounds),
+                span=(start, end), tokens=last - first
+            )
+
+    def _merged(self, parts):
+        units = [unit for unit, _ in parts]
+        if len({unit.label for unit in units}) > 1:
+            text = "\n\n".join(f"{unit.label}: {unit.text}" for unit in units)
+        else:
+            text = "\n\n".join(unit.text for unit in units)
+        return Chunk(text=text, units=units, tokens=sum(tokens for _, tokens in parts))
+
+    def chunks(self, units):
+        """Yield Chunks in source order"""
+        parts, total = [], 0
+        for unit, spans in self._measured(units):
+            tokens = len(spans)
+            if tokens == 0:
+                continue
+            if tokens > self.max_tokens:
+                if parts:
+                    yield self._merged(parts)
+                    parts, total = [], 0
+                yield from self._windows(unit, spans)
+                continue
+
+            # A few tokens per part for the label prefix a mixed chunk gets
+            cost = tokens + (4 if unit.label else 0)
+            if parts and (
+                unit.group != parts[0][0].group
+                or total + cost > self.max_tokens
+                or (total >= self.merge_below and tokens >= self.merge_below)
+            ):
+                yield self._merged(parts)
+                parts, total = [], 0
+            parts.append((unit, tokens))
+            total += cost
+        if parts:
+            yield self._merged(parts)
@@ -1,34 +1,114 @@
+import argparse
 import json
-import pandas as pd
 from datetime import datetime
 
-# Load the exported JSON
-with open('assets/erinGPTfile/conversations.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
-
-# Flatten into a list of message records
-messages = []
-for convo in data:
-    title = convo.get('title', 'Untitled')
-    create_time = datetime.fromtimestamp(convo.get('create_time', 0))
-    for msg in convo.get('mapping', {}).values():
-        info = msg.get('message')
-        if info and info.get('content') and info['content'].get('parts'):
-            role = info.get('author', {}).get('role', 'unknown')
-            content = info['content']['parts'][0]
-            messages.append({
-                'conversation_title': title,
-                'timestamp': create_time,
-                'role': role,
-                'content': content
-            })
-
-# Create DataFrame
-df = pd.DataFrame(messages)
-
-# Optional: Filter out system/internal messages
-df = df[df['role'].isin(['user', 'assistant'])]
-
-# Save cleaned data
-df.to_csv('cleaned_chatgpt_history.csv', index=False)
-print(f"Exported {len(df)} messages to CSV.")
\ No newline at end of file
+from corpus import CORPUS_PATH, CSV_PATH, CorpusWriter
+
+
+def iter_json_array(f, chunk_size=1 << 20):
+    """Yield the elements of a top-level JSON array one at a time.
+
+    Only the current element (plus one read buffer) is held in memory. When
+    an element spans several reads, the read size doubles so re-parsing the
+    partial element stays linear overall.
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size).lstrip()
+    while not buf:
+        more = f.read(chunk_size)
+        if not more:
+            break
+        buf = more.lstrip()
+    if not buf.startswith('['):
+        raise ValueError("Expected a top-level JSON array")
+    pos = 1
+    read_size = chunk_size
+    eof = False
+
+    while True:
+        # Skip whitespace and the comma between elements
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+
+        try:
+            if pos >= len(buf):
+                raise json.JSONDecodeError("Buffer exhausted", buf, pos)
+            obj, end = decoder.raw_decode(buf, pos)
+            # A number can decode from a cut-off prefix (12 of 12345, -0 of
+            # -0.5), so a value is only complete once a delimiter follows it
+            if not eof and (end >= len(buf) or buf[end] not in ' \t\r\n,]'):
+                raise json.JSONDecodeError("Value may continue in the next read", buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = f.read(read_size)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+            read_size *= 2
+            continue
+
+        yield obj
+        pos = end
+        read_size = chunk_size
+        # Drop consumed text so the buffer never holds more than one element
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
+
+
+def iter_mapping_in_order(mapping):
+    """Walk a conversation's mapping tree root-first, following children in order"""
+    roots = [node_id for node_id, node in mapping.items() if not node.get('parent') or node['parent'] not in mapping]
+    stack = list(reversed(roots))
+    seen = set()
+    while stack:
+        node_id = stack.pop()
+        if node_id in seen or node_id not in mapping:
+            continue
+        seen.add(node_id)
+        node = mapping[node_id]
+        yield node
+        stack.extend(reversed(node.get('children', [])))
+
+
+def iter_messages(conversations, roles=('user', 'assistant')):
+    """Flatten conversations into message records, in conversation order"""
+    for convo in conversations:
+        title = convo.get('title', 'Untitled')
+        timestamp = datetime.fromtimestamp(convo.get('create_time') or 0)
+        for msg in iter_mapping_in_order(convo.get('mapping') or {}):
+            info = msg.get('message')
+            if info and info.get('content') and info['content'].get('parts'):
+                role = info.get('author', {}).get('role', 'unknown')
+                # Optional: Filter out system/internal messages
+                if roles and role not in roles:
+                    continue
+                yield {
+                    'conversation_title': title,
+                    'timestamp': timestamp,
+                    'role': role,
+                    'content': info['content']['parts'][0]
+                }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a ChatGPT conversations.json export into the transcript corpus")
+    parser.add_argument('--input', default='assets/erinGPTfile/conversations.json')
+    parser.add_argument('--output', default=CORPUS_PATH, help="Parquet corpus path")
+    parser.add_argument('--csv', nargs='?', const=CSV_PATH, default=None,
+                        help="also write the legacy CSV (optionally to a given path)")
+    args = parser.parse_args()
+
+    # Stream the exported JSON one conversation at a time
+    with open(args.input, 'r', encoding='utf-8') as f, CorpusWriter(args.output, csv_path=args.csv) as writer:
+        for message in iter_messages(iter_json_array(f)):
+            writer.write(message)
+
+    print(f"Exported {writer.count} messages to {args.output}" + (f" and {args.csv}" if args.csv else "") + ".")
+
+
+if __name__ == '__main__':
+    main()
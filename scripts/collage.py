@@ -0,0 +1,259 @@
+"""Collage generation from cached, downscaled art therapy drawings"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+CANVAS_COLOR = (250, 248, 245)
+ROTATIONS = [0, 90, 180, 270, 45, -45]
+
+# Pillow format name -> (file extension, mimetype, save options)
+IMAGE_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg', {'quality': 85}),
+    'WEBP': ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+}
+
+
+class DrawingCache:
+    """Decoded drawings held as downscaled RGB arrays, evicted LRU past a memory budget"""
+
+    def __init__(self, max_side=2048, memory_budget_mb=128):
+        self.max_side = max_side
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._arrays = OrderedDict()
+        self._bytes = 0
+        self._missing = set()
+        self._lock = threading.Lock()
+
+    def _decode(self, path):
+        img = Image.open(path)
+        # Let libjpeg decode at a reduced scale instead of full resolution
+        img.draft('RGB', (self.max_side, self.max_side))
+        img = img.convert('RGB')
+        img.thumbnail((self.max_side, self.max_side))
+        return np.asarray(img)
+
+    def get(self, path):
+        """Return the cached array for a drawing, decoding it on first use"""
+        with self._lock:
+            if path in self._arrays:
+                self._arrays.move_to_end(path)
+                return self._arrays[path]
+            if path in self._missing:
+                return None
+
+        try:
+            array = self._decode(path)
+        except Exception as e:
+            # Remember unreadable drawings so they aren't retried on every request
+            log.warning("Could not load drawing %s: %s", os.path.basename(path), e)
+            with self._lock:
+                self._missing.add(path)
+            return None
+
+        with self._lock:
+            if path not in self._arrays:
+                self._arrays[path] = array
+                self._bytes += array.nbytes
+                # Evict least recently used drawings, always keeping the newest
+                while self._bytes > self.memory_budget and len(self._arrays) > 1:
+                    _, evicted = self._arrays.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+            return self._arrays[path]
+
+    def preload(self, paths):
+        """Decode every drawing up front (e.g. from a startup thread)"""
+        for path in paths:
+            if os.path.exists(path):
+                self.get(path)
+        log.info("Drawing cache ready: %d drawings, %.1f MB", len(self._arrays), self._bytes / 1024 / 1024)
+
+
+# Shared by every request unless a caller brings its own cache
+default_cache = DrawingCache()
+
+
+def alpha_lut(factor):
+    """256-entry lookup table scaling alpha by factor"""
+    return (np.arange(256) * factor).astype(np.uint8).tolist()
+
+
+def render_collage(drawing_files, output_size=(700, 350), num_pieces=10, cache=None, rng=None):
+    """Compose a collage image from random pieces of drawings"""
+    cache = cache or default_cache
+    rng = rng or random
+
+    # Create blank canvas with slight off-white
+    collage = Image.new('RGB', output_size, CANVAS_COLOR)
+
+    for _ in range(num_pieces):
+        # Pick random drawing
+        array = cache.get(rng.choice(drawing_files))
+        if array is None:
+            continue
+        height, width = array.shape[:2]
+
+        # Random crop size
+        crop_w = rng.randint(80, 250)
+        crop_h = rng.randint(80, 250)
+
+        # Random position in source image
+        max_x = max(0, width - crop_w)
+        max_y = max(0, height - crop_h)
+        x = rng.randint(0, max_x) if max_x > 0 else 0
+        y = rng.randint(0, max_y) if max_y > 0 else 0
+
+        # Crop piece straight out of the cached array
+        piece = Image.fromarray(array[y:y + crop_h, x:x + crop_w]).convert('RGBA')
+
+        # Random rotation
+        angle = rng.choice(ROTATIONS)
+        piece = piece.rotate(angle, expand=True, fillcolor=CANVAS_COLOR + (0,))
+
+        # Random position on canvas
+        if piece.width < output_size[0] and piece.height < output_size[1]:
+            paste_x = rng.randint(0, output_size[0] - piece.width)
+            paste_y = rng.randint(0, output_size[1] - piece.height)
+
+            # Apply transparency for layering via a lookup table, not a per-pixel callback
+            alpha = piece.getchannel('A').point(alpha_lut(rng.uniform(0.6, 0.9)))
+            piece.putalpha(alpha)
+            collage.paste(piece, (paste_x, paste_y), piece)
+
+    return collage
+
+
+def encode_collage(collage, image_format='JPEG'):
+    """Encode a collage image to bytes in one of IMAGE_FORMATS"""
+    _, _, options = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    collage.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def create_collage_for_query(drawing_files, output_size=(700, 350), num_pieces=10, cache=None, rng=None):
+    """Create a unique collage as a base64 JPEG data URI for embedding in HTML"""
+    img_data = base64.b64encode(encode_collage(render_collage(drawing_files, output_size, num_pieces, cache, rng)))
+    return f"data:image/jpeg;base64,{img_data.decode()}"
+
+
+class CollageStore:
+    """Content-addressed, LRU-bounded in-memory store of encoded collages"""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, data, image_format='JPEG'):
+        """Store encoded bytes and return the file name they are served under"""
+        extension, mimetype, _ = IMAGE_FORMATS[image_format]
+        name = f"{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+        with self._lock:
+            self._items[name] = (data, mimetype)
+            self._items.move_to_end(name)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return name
+
+    def get(self, name):
+        """Return (bytes, mimetype) for a stored collage, or None once evicted"""
+        with self._lock:
+            item = self._items.get(name)
+            if item is not None:
+                self._items.move_to_end(name)
+            return item
+
+
+class CollagePool:
+    """Keeps a bounded queue of ready, encoded collages refilled by a background worker"""
+
+    def __init__(self, drawing_files, size=8, seed=None, cache=None, image_format='JPEG', observer=None):
+        self.drawing_files = drawing_files
+        # Optional observer(stage, seconds) callback for render/encode timings
+        self.observer = observer
+        self.size = size
+        self.image_format = image_format
+        self.cache = cache or default_cache
+        # One seeded generator for the pool makes its output sequence reproducible
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=size)
+        self._stop = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def _make(self):
+        started = time.perf_counter()
+        with self._rng_lock:
+            collage = render_collage(self.drawing_files, cache=self.cache, rng=self._rng)
+            self.generated += 1
+        rendered = time.perf_counter()
+        # Encoding doesn't touch the generator, so it can run outside the lock
+        data = encode_collage(collage, self.image_format)
+        if self.observer:
+            self.observer('collage_render', rendered - started)
+            self.observer('collage_encode', time.perf_counter() - rendered)
+        return data
+
+    def _run(self):
+        self.cache.preload(self.drawing_files)
+        while not self._stop.is_set():
+            collage = self._make()
+            # Blocks while the pool is full; the timeout lets stop() take effect
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(collage, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def start(self):
+        """Start the background refill worker"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="collage-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def fill(self):
+        """Synchronously top the pool up to capacity (no worker needed)"""
+        while not self._queue.full():
+            self._queue.put(self._make())
+
+    def get(self):
+        """Pop a ready encoded collage, generating one inline if the pool has run dry"""
+        try:
+            collage = self._queue.get_nowait()
+            self.hits += 1
+            return collage
+        except queue.Empty:
+            self.misses += 1
+            return self._make()
+
+    def stats(self):
+        return {
+            "ready": self._queue.qsize(),
+            "capacity": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated
+        }
@@ -0,0 +1,190 @@
+"""Columnar (Parquet) storage for the cleaned transcript corpus"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+CORPUS_PATH = 'assets/cleaned_chatgpt_history.parquet'
+CSV_PATH = 'assets/cleaned_chatgpt_history.csv'
+
+COLUMNS = ['message_id', 'conversation_title', 'timestamp', 'role', 'content']
+CSV_COLUMNS = ['conversation_title', 'timestamp', 'role', 'content']
+
+
+def content_hash(*parts):
+    """Stable short digest of JSON-serializable parts"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+
+
+def unique_id(prefix, digest, counts):
+    """Build an ID from a digest, suffixing repeats so identical documents stay distinct"""
+    n = counts.get(digest, 0)
+    counts[digest] = n + 1
+    return f"{prefix}_{digest}" if n == 0 else f"{prefix}_{digest}_{n}"
+
+
+def format_timestamp(value):
+    """Render a timestamp the way the CSV always has: 'YYYY-MM-DD HH:MM:SS.ffffff'"""
+    if isinstance(value, str):
+        value = pd.Timestamp(value)
+    return value.isoformat(sep=' ', timespec='microseconds')
+
+
+def transcript_metadata(title, timestamp, role):
+    return {
+        "timestamp": format_timestamp(timestamp),
+        "role": str(role),
+        "conversation_title": str(title)
+    }
+
+
+def index_metadata(title, timestamp, role):
+    """Metadata stored with each embedded message.
+
+    Adds what filters and grouping need on top of transcript_metadata (which
+    stays as it is, since message IDs hash it): the timestamp as epoch
+    seconds for range filters, and a short conversation ID for grouping.
+    """
+    metadata = transcript_metadata(title, timestamp, role)
+    # Naive timestamps are read as UTC, the same way the query API reads them
+    metadata["timestamp_epoch"] = int(pd.Timestamp(metadata["timestamp"]).timestamp())
+    # A message's timestamp is its conversation's create_time, so title plus
+    # timestamp tells apart conversations that share a title ("New chat")
+    metadata["conversation_id"] = content_hash(metadata["conversation_title"], metadata["timestamp"])[:12]
+    return metadata
+
+
+def message_id(content, metadata, counts):
+    """ID depends only on the message itself, never on its row number"""
+    return unique_id("msg", content_hash(str(content), metadata), counts)
+
+
+def corpus_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('message_id', pa.string()),
+        # Few distinct titles and roles across many rows: dictionary-encode them
+        ('conversation_title', pa.dictionary(pa.int32(), pa.string())),
+        ('timestamp', pa.timestamp('us')),
+        ('role', pa.dictionary(pa.int8(), pa.string())),
+        ('content', pa.string()),
+    ])
+
+
+class CorpusWriter:
+    """Streams message records into the Parquet corpus, optionally teeing a compatibility CSV"""
+
+    def __init__(self, path=CORPUS_PATH, csv_path=None, batch_size=10000):
+        import pyarrow.parquet as pq
+        self.schema = corpus_schema()
+        self.batch_size = batch_size
+        self.count = 0
+        self._batch = []
+        self._counts = {}
+        self._writer = pq.ParquetWriter(path, self.schema)
+        self._csv_file = None
+        if csv_path:
+            self._csv_file = open(csv_path, 'w', newline='', encoding='utf-8')
+            self._csv = csv.DictWriter(self._csv_file, fieldnames=CSV_COLUMNS)
+            self._csv.writeheader()
+
+    def write(self, message):
+        """Add one {conversation_title, timestamp, role, content} record"""
+        timestamp = message['timestamp']
+        if isinstance(timestamp, str):
+            timestamp = pd.Timestamp(timestamp).to_pydatetime()
+        content = message['content']
+        # Missing content stays null rather than becoming the string 'nan'
+        content = None if content is None or (isinstance(content, float) and pd.isna(content)) else str(content)
+        metadata = transcript_metadata(message['conversation_title'], timestamp, message['role'])
+
+        self._batch.append({
+            'message_id': message_id(content, metadata, self._counts),
+            'conversation_title': metadata['conversation_title'],
+            'timestamp': timestamp,
+            'role': metadata['role'],
+            'content': content
+        })
+        if self._csv_file:
+            self._csv.writerow({**metadata, 'content': content})
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        if self._batch:
+            self._writer.write_table(pa.Table.from_pylist(self._batch, schema=self.schema))
+            self.count += len(self._batch)
+            self._batch = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        if self._csv_file:
+            self._csv_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_corpus(path=CORPUS_PATH, columns=None, memory_map=True):
+    """Read the corpus as an Arrow table, projecting only the requested columns"""
+    import pyarrow.parquet as pq
+    return pq.read_table(path, columns=columns, memory_map=memory_map)
+
+
+def _csv_batches(csv_path, batch_size):
+    """Legacy fallback: CSV chunks typed and keyed the same way as the Parquet corpus"""
+    counts = {}
+    for df in pd.read_csv(csv_path, chunksize=batch_size):
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+        df['content'] = df['content'].astype(object).where(df['content'].notna(), None)
+        df['message_id'] = [
+            message_id(content, transcript_metadata(title, ts, role), counts)
+            for title, ts, role, content in zip(df['conversation_title'], df['timestamp'], df['role'], df['content'])
+        ]
+        yield df
+
+
+def iter_message_batches(columns=None, batch_size=10000, path=CORPUS_PATH, csv_path=CSV_PATH):
+    """Yield the corpus as DataFrame batches; falls back to the CSV when no Parquet exists"""
+    if os.path.exists(path):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for df in _csv_batches(csv_path, batch_size):
+            yield df[columns] if columns else df
+
+
+def load_messages(columns=None, path=CORPUS_PATH, csv_path=CSV_PATH):
+    """Load the whole corpus (or just some columns) into one DataFrame"""
+    if os.path.exists(path):
+        return read_corpus(path, columns).to_pandas()
+    return pd.concat(list(iter_message_batches(columns, path=path, csv_path=csv_path)), ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the cleaned transcript CSV into the Parquet corpus")
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--output', default=CORPUS_PATH)
+    args = parser.parse_args()
+
+    with CorpusWriter(args.output) as writer:
+        for df in pd.read_csv(args.csv, chunksize=10000):
+            for record in df[CSV_COLUMNS].to_dict('records'):
+                writer.write(record)
+
+    print(f"✓ Wrote {writer.count} messages to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,16 @@
 from PIL import Image
 import numpy as np
-from sklearn.cluster import KMeans
+import argparse
+import hashlib
 import json
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+DRAWINGS_DIR = 'assets/atdrawings'
+OUTPUT_PATH = 'assets/art_palettes.json'
+CACHE_PATH = 'assets/.palette_cache.json'
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png')
 
 def is_vivid_color(rgb, saturation_threshold=30, brightness_range=(40, 240)):
     """Check if a color is vivid (not white, black, or gray)"""
@@ -24,7 +32,28 @@ def is_vivid_color(rgb, saturation_threshold=30, brightness_range=(40, 240)):
     
     return True
 
-def extract_palette(image_path, n_colors=12, target_colors=8):
+def cluster_colors(pixels, n_colors, method):
+    """Find n_colors representative colors with the chosen method"""
+    if method == 'histogram':
+        # Quantize to 16 levels per channel and average the pixels in the busiest bins
+        bins = (pixels[:, 0] // 16).astype(np.int32) * 256 + (pixels[:, 1] // 16) * 16 + pixels[:, 2] // 16
+        counts = np.bincount(bins, minlength=4096)
+        sums = np.stack([np.bincount(bins, weights=pixels[:, c], minlength=4096) for c in range(3)], axis=1)
+        top = np.argsort(counts, kind='stable')[::-1][:n_colors]
+        top = top[counts[top] > 0]
+        return (sums[top] / counts[top, None]).astype(int)
+
+    if method == 'minibatch':
+        from sklearn.cluster import MiniBatchKMeans
+        kmeans = MiniBatchKMeans(n_clusters=n_colors, random_state=42, n_init=3)
+    else:
+        from sklearn.cluster import KMeans
+        kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init=10)
+    kmeans.fit(pixels)
+    return kmeans.cluster_centers_.astype(int)
+
+
+def extract_palette(image_path, n_colors=12, target_colors=8, method='kmeans'):
     """Extract dominant VIVID colors from an image"""
     print(f"Processing: {os.path.basename(image_path)}")
     
@@ -36,10 +65,7 @@ def extract_palette(image_path, n_colors=12, target_colors=8):
     pixels = img_array.reshape(-1, 3)
     
     # Extract more colors than needed, then filter
-    kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init=10)
-    kmeans.fit(pixels)
-    
-    colors = kmeans.cluster_centers_.astype(int)
+    colors = cluster_colors(pixels, n_colors, method)
     
     # Filter for vivid colors only
     vivid_colors = [color for color in colors if is_vivid_color(color)]
@@ -64,49 +90,97 @@ def extract_palette(image_path, n_colors=12, target_colors=8):
         "hex": hex_colors
     }
 
-# List of your image files in chronological order
-image_files = [
-    "8.12.25.jpeg",
-    "9.18.25.jpeg",
-    "9.25.25.jpeg",
-    "10.9.25.jpeg",
-    "10.16.25.jpeg",
-    "10.23.25.jpeg",
-    "11.6.25.jpeg",
-    "11.13.25.jpeg",
-    "11.20.25.jpeg",
-    "12.11.25.jpeg"
-]
-
-print("Extracting VIVID color palettes from art therapy drawings...")
-print("(Filtering out whites, grays, and near-blacks)")
-print("="*60)
-
-palette_data = {}
-
-for img_file in image_files:
-    img_path = f'assets/atdrawings/{img_file}'
-    
-    if os.path.exists(img_path):
-        palette = extract_palette(img_path, n_colors=12, target_colors=8)
-        # Use date as key (remove .jpeg extension)
-        date_key = img_file.replace('.jpeg', '')
-        palette_data[date_key] = palette
-    else:
-        print(f"Warning: {img_path} not found")
 
-print("="*60)
-print(f"✓ Extracted palettes from {len(palette_data)} drawings")
+def drawing_sort_key(filename):
+    """Chronological order for M.D.YY file names; anything else sorts after, by name"""
+    match = re.match(r"^(\d{1,2})\.(\d{1,2})\.(\d{2})\.", filename)
+    if match:
+        month, day, year = (int(g) for g in match.groups())
+        return (0, year, month, day, filename)
+    return (1, 0, 0, 0, filename)
+
+
+def discover_drawings(drawings_dir=DRAWINGS_DIR):
+    """Every image in the drawings folder, in chronological order"""
+    files = [f for f in os.listdir(drawings_dir) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    return sorted(files, key=drawing_sort_key)
+
+
+def cache_key(image_path, params):
+    """File content hash plus extraction parameters"""
+    with open(image_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return f"{digest}:{json.dumps(params, sort_keys=True)}"
+
+
+def load_cache(path=CACHE_PATH):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    with open(path, 'w') as f:
+        json.dump(cache, f, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract vivid color palettes from the art therapy drawings")
+    parser.add_argument('--method', choices=['kmeans', 'minibatch', 'histogram'], default='kmeans',
+                        help="kmeans matches earlier palettes; minibatch and histogram are much faster")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--no-cache', action='store_true', help="recompute every palette")
+    args = parser.parse_args()
+
+    params = {"n_colors": 12, "target_colors": 8, "method": args.method}
+
+    print("Extracting VIVID color palettes from art therapy drawings...")
+    print("(Filtering out whites, grays, and near-blacks)")
+    print("="*60)
+
+    # Pick up new drawings automatically, in chronological order
+    image_files = discover_drawings()
+    cache = {} if args.no_cache else load_cache()
+
+    keys = {img_file: cache_key(os.path.join(DRAWINGS_DIR, img_file), params) for img_file in image_files}
+    stale = [img_file for img_file in image_files if keys[img_file] not in cache]
+    print(f"{len(image_files) - len(stale)} palettes unchanged, {len(stale)} to extract")
+
+    # Only changed or new drawings are clustered, in parallel
+    if stale:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            palettes = pool.map(
+                extract_palette,
+                [os.path.join(DRAWINGS_DIR, f) for f in stale],
+                [params["n_colors"]] * len(stale),
+                [params["target_colors"]] * len(stale),
+                [params["method"]] * len(stale)
+            )
+            for img_file, palette in zip(stale, palettes):
+                cache[keys[img_file]] = palette
+
+    # Use date as key (remove extension)
+    palette_data = {os.path.splitext(f)[0]: cache[keys[f]] for f in image_files}
+
+    # Drop entries for drawings that changed or were removed
+    save_cache({keys[f]: cache[keys[f]] for f in image_files})
+
+    print("="*60)
+    print(f"✓ Extracted palettes from {len(palette_data)} drawings")
+
+    # Save to JSON for frontend use
+    with open(OUTPUT_PATH, 'w') as f:
+        json.dump(palette_data, f, indent=2)
+
+    print(f"✓ Saved color data to: {OUTPUT_PATH}")
 
-# Save to JSON for frontend use
-output_path = 'assets/art_palettes.json'
-with open(output_path, 'w') as f:
-    json.dump(palette_data, f, indent=2)
+    # Preview all palettes
+    print("\nPreview of extracted vivid colors:")
+    for drawing_name, palette in palette_data.items():
+        print(f"\n{drawing_name}:")
+        print(f"  {', '.join(palette['hex'][:6])}")
 
-print(f"✓ Saved color data to: {output_path}")
 
-# Preview all palettes
-print("\nPreview of extracted vivid colors:")
-for drawing_name, palette in palette_data.items():
-    print(f"\n{drawing_name}:")
-    print(f"  {', '.join(palette['hex'][:6])}")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
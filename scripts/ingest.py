@@ -0,0 +1,223 @@
+"""Shared batched, incremental ingestion for the vectorize scripts"""
+import json
+import os
+import sys
+
+from chunking import TokenChunker, Unit
+from corpus import content_hash, index_metadata, iter_message_batches, unique_id
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'rag'))
+from embeddings import BACKENDS, EMBEDDING_BACKEND, MODEL_NAME, load_embedding_function
+from lexical_index import LEXICAL_DIR, LexicalIndexBuilder
+
+# Resolved from the repo root like the API's paths, so a run from any
+# directory writes vectors, manifest and BM25 index where the API reads them
+CHROMA_PATH = os.path.join(BASE_DIR, 'rag', 'chroma_db')
+MANIFEST_DIR = os.path.join(BASE_DIR, 'rag', 'manifests')
+
+
+def load_embedder(backend=None, model_name=MODEL_NAME):
+    """Load the same embedding backend the API uses for queries (EMBEDDING_BACKEND by default)"""
+    return load_embedding_function(backend, model_name)
+
+
+def lexical_builder(collection_name, lexical_dir=LEXICAL_DIR):
+    """BM25 index builder for a collection; run_ingestion feeds it every current row"""
+    return LexicalIndexBuilder(os.path.join(lexical_dir, collection_name), collection_name)
+
+
+def iter_transcript_rows(chunker, batch_size=1000):
+    """Stream (id, document, metadata) chunks of the transcript corpus.
+
+    Turns are merged and split per conversation by chunker (a
+    chunking.TokenChunker). A chunk that is exactly one message keeps that
+    message's ID; merged chunks and windows get IDs derived from theirs and
+    from their own text.
+    """
+    def units():
+        for df in iter_message_batches(batch_size=batch_size):
+            # Filter out rows with empty content
+            df = df.dropna(subset=['content'])
+            df = df[df['content'].astype(str).str.strip() != '']
+
+            # The corpus already carries stable content-hash message IDs
+            for doc_id, title, timestamp, role, content in zip(
+                df['message_id'], df['conversation_title'], df['timestamp'], df['role'], df['content']
+            ):
+                metadata = index_metadata(title, timestamp, role)
+                yield Unit(group=metadata["conversation_id"], text=str(content), payload=(doc_id, metadata), label=str(role))
+
+    for chunk in chunker.chunks(units()):
+        yield transcript_chunk_row(chunk)
+
+
+def transcript_chunk_row(chunk):
+    """ID and metadata of a transcript chunk, pointing back at its messages"""
+    message_ids = [unit.payload[0] for unit in chunk.units]
+    metadatas = [unit.payload[1] for unit in chunk.units]
+
+    # role names whoever wrote most of the chunk, for display; a merged chunk
+    # can mix roles, so filters match has_<role>, set for every role in it
+    length_by_role = {}
+    for unit in chunk.units:
+        length_by_role[unit.label] = length_by_role.get(unit.label, 0) + len(unit.text)
+    metadata = dict(metadatas[0])
+    metadata.update({f"has_{role}": True for role in length_by_role})
+    metadata.update(
+        role=max(length_by_role, key=length_by_role.get),
+        roles=",".join(sorted(length_by_role)),
+        message_ids=",".join(message_ids),
+        message_count=len(message_ids),
+        timestamp_end_epoch=metadatas[-1]["timestamp_epoch"],
+        tokens=chunk.tokens
+    )
+
+    # IDs follow the text: when windowing or merging settings change, the
+    # manifest sees new IDs and re-embeds, instead of updating metadata
+    # over a stale document and vector
+    if chunk.window is not None:
+        metadata.update(window=chunk.window, windows=chunk.windows, char_start=chunk.span[0], char_end=chunk.span[1])
+        doc_id = f"{message_ids[0]}_w{content_hash(chunk.span, chunk.text)[:12]}"
+    elif len(message_ids) == 1:
+        # The message ID already hashes its content
+        doc_id = message_ids[0]
+    else:
+        doc_id = f"chunk_{content_hash(message_ids, chunk.text)}"
+    return doc_id, chunk.text, metadata
+
+
+def iter_note_rows(notes_path, chunker):
+    """Stream (id, document, metadata) chunks of the class notes, packed by paragraph"""
+    with open(notes_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    paragraphs = (
+        Unit(group="notes", text=para.strip(), payload=idx)
+        for idx, para in enumerate(content.split('\n\n')) if para.strip()
+    )
+    counts = {}
+    for idx, chunk in enumerate(chunker.chunks(paragraphs)):
+        # chunk_id is positional metadata; the ID hashes only the text
+        metadata = {
+            "source": "class_notes",
+            "chunk_id": idx,
+            "paragraphs": ",".join(str(unit.payload) for unit in chunk.units),
+            "tokens": chunk.tokens
+        }
+        if chunk.window is not None:
+            metadata.update(window=chunk.window, windows=chunk.windows, char_start=chunk.span[0], char_end=chunk.span[1])
+        yield unique_id("note", content_hash(chunk.text), counts), chunk.text, metadata
+
+
+def batched(rows, batch_size):
+    """Group an iterable of rows into lists of at most batch_size"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Manifest:
+    """Records which document IDs (and metadata digests) are already embedded"""
+
+    def __init__(self, collection_name, manifest_dir=MANIFEST_DIR):
+        self.path = os.path.join(manifest_dir, f"{collection_name}.json")
+        self.entries = {}
+
+    def load(self, collection):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+            count = collection.count()
+            if count == len(self.entries):
+                return self.entries
+            # e.g. rag/chroma_db was deleted to force a rebuild: trusting the
+            # manifest would skip every row and leave the collection empty
+            print(f"Manifest lists {len(self.entries)} documents but the collection holds {count}; "
+                  f"rebuilding it from the collection")
+
+        # No (usable) manifest: adopt whatever the collection already holds so
+        # stale (e.g. positional) IDs get cleaned up on this run; None digests
+        # refresh their metadata without re-embedding
+        self.entries = {doc_id: None for doc_id in collection.get(include=[])['ids']}
+        return self.entries
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        # Atomic replace so a crash mid-write never leaves a corrupt manifest
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_ingestion(collection, rows, embedder, batch_size=256, manifest=None, label="rows", lexical=None):
+    """Embed only new or changed rows in batches, then delete rows that disappeared.
+
+    A lexical builder sees every row, changed or not, and is rewritten at the
+    end, so the BM25 index always matches the collection.
+    """
+    entries = manifest.load(collection) if manifest else {}
+    seen = set()
+    stale_metadata = []
+
+    def pending():
+        for doc_id, document, metadata in rows:
+            seen.add(doc_id)
+            if lexical is not None:
+                lexical.add(doc_id, document, metadata)
+            meta_digest = content_hash(metadata)
+            if doc_id not in entries:
+                yield doc_id, document, metadata, meta_digest
+            elif entries[doc_id] != meta_digest:
+                # Same content, different metadata: update without re-embedding
+                stale_metadata.append((doc_id, metadata, meta_digest))
+
+    added = 0
+    for batch in batched(pending(), batch_size):
+        ids, documents, metadatas, digests = zip(*batch)
+
+        # One forward pass and one write per batch
+        embeddings = embedder.encode(list(documents), batch_size=batch_size).tolist()
+        collection.upsert(
+            ids=list(ids),
+            documents=list(documents),
+            metadatas=list(metadatas),
+            embeddings=embeddings
+        )
+
+        # Saving after every batch makes the manifest the resume point too
+        entries.update(zip(ids, digests))
+        if manifest:
+            manifest.save()
+        added += len(batch)
+        print(f"Embedded {added} new {label}...")
+
+    for batch in batched(stale_metadata, batch_size):
+        ids, metadatas, digests = zip(*batch)
+        collection.update(ids=list(ids), metadatas=list(metadatas))
+        entries.update(zip(ids, digests))
+
+    removed = [doc_id for doc_id in entries if doc_id not in seen]
+    for batch in batched(removed, batch_size):
+        collection.delete(ids=batch)
+        for doc_id in batch:
+            del entries[doc_id]
+
+    if manifest:
+        manifest.save()
+    if lexical is not None:
+        print(f"BM25 index: {lexical.write()} {label} -> {lexical.path}")
+    print(f"{added} {label} embedded, {len(stale_metadata)} updated, "
+          f"{len(removed)} removed, {len(seen) - added - len(stale_metadata)} unchanged")
+    return added, len(removed)
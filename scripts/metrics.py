@@ -0,0 +1,111 @@
+"""In-process latency histograms exposed in Prometheus text format"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a sub-millisecond cache hit up to a slow CPU generation
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a single optional label"""
+
+    def __init__(self, name, help_text, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(label_value, [0] * (len(self.buckets) + 1) + [0.0])
+            series[index] += 1
+            series[-1] += value
+
+    def _labels(self, label_value, extra=None):
+        pairs = []
+        if self.label is not None:
+            pairs.append(f'{self.label}="{label_value}"')
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for label_value, counts in sorted(series.items(), key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._labels(label_value, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(label_value)} {counts[-1]}")
+            lines.append(f"{self.name}_count{self._labels(label_value)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Histograms plus gauges and counters whose values are read at scrape time"""
+
+    def __init__(self):
+        self._histograms = []
+        self._collected = []  # (name, help, type, read, label); read returns a number or {label value: number}
+
+    def histogram(self, name, help_text, label=None, buckets=DEFAULT_BUCKETS):
+        histogram = Histogram(name, help_text, label, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def gauge(self, name, help_text, read, label=None):
+        self._collected.append((name, help_text, "gauge", read, label))
+
+    def counter(self, name, help_text, read, label=None):
+        self._collected.append((name, help_text, "counter", read, label))
+
+    def render(self):
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for name, help_text, kind, read, label in self._collected:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            value = read()
+            if isinstance(value, dict):
+                for label_value, number in value.items():
+                    lines.append(f'{name}{{{label}="{label_value}"}} {number}')
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Per-request stage durations, mirrored into a stage histogram"""
+
+    def __init__(self, histogram=None):
+        self.histogram = histogram
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+        if self.histogram is not None:
+            self.histogram.observe(seconds, stage)
+
+    @contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def server_timing(self):
+        """Format durations for a Server-Timing response header"""
+        with self._lock:
+            return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.durations.items())
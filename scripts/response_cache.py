@@ -0,0 +1,147 @@
+"""TTL + LRU cache of generated answers, with an optional semantic tier"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_prompt(prompt):
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip("?!. ")
+
+
+class ResponseCache:
+    """Answers keyed on normalized prompt text plus n_results (and a scope, e.g. retrieval filters).
+
+    When semantic_threshold is set, a miss on the exact key can still be
+    served by a cached entry whose query embedding has cosine similarity at
+    or above the threshold. When db_path is set, entries are mirrored to
+    SQLite and reloaded on startup. Scoped entries are exact-match only.
+    """
+
+    def __init__(self, max_items=256, ttl=3600, semantic_threshold=None, db_path=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()  # key -> (created, n_results, value, unit embedding or None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, created REAL, n_results INTEGER, value TEXT, embedding BLOB)"
+            )
+            self._load()
+
+    @staticmethod
+    def key(prompt, n_results, scope=""):
+        if scope:
+            return f"{n_results}:{scope}:{normalize_prompt(prompt)}"
+        return f"{n_results}:{normalize_prompt(prompt)}"
+
+    @staticmethod
+    def _unit(embedding):
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        rows = self._db.execute(
+            "SELECT key, created, n_results, value, embedding FROM responses "
+            "WHERE created >= ? ORDER BY created DESC LIMIT ?",
+            (cutoff, self.max_items)
+        ).fetchall()
+        for key, created, n_results, value, blob in reversed(rows):
+            embedding = np.frombuffer(blob, dtype=np.float32) if blob else None
+            self._entries[key] = (created, n_results, json.loads(value), embedding)
+        self._db.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+        self._db.commit()
+
+    def _drop(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+        if self._db and keys:
+            self._db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in keys])
+            self._db.commit()
+
+    def _expire(self, now):
+        expired = [k for k, entry in self._entries.items() if now - entry[0] > self.ttl]
+        self._drop(expired)
+
+    def get(self, prompt, n_results, embed=None, scope=""):
+        """Look up a cached answer; returns (value, tier, embedding).
+
+        embed is a zero-argument callable producing the query embedding. It is
+        only called when the exact key misses and the semantic tier is on, and
+        whatever it returns is handed back so the caller can reuse it.
+        """
+        key = self.key(prompt, n_results, scope)
+        with self._lock:
+            self._expire(time.time())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][2], "exact", None
+            semantic = self.semantic_threshold is not None and embed is not None and not scope
+
+        # Embed outside the lock; it's by far the slowest step
+        embedding = embed() if semantic else None
+
+        with self._lock:
+            if embedding is not None:
+                candidates = [
+                    (k, entry[3]) for k, entry in self._entries.items()
+                    if entry[1] == n_results and entry[3] is not None
+                ]
+                if candidates:
+                    scores = np.stack([c[1] for c in candidates]) @ self._unit(embedding)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.semantic_threshold:
+                        best_key = candidates[best][0]
+                        self._entries.move_to_end(best_key)
+                        self.semantic_hits += 1
+                        return self._entries[best_key][2], "semantic", embedding
+
+            self.misses += 1
+            return None, None, embedding
+
+    def put(self, prompt, n_results, value, embedding=None, scope=""):
+        key = self.key(prompt, n_results, scope)
+        created = time.time()
+        # Without an embedding a scoped entry can't be a semantic match for an unscoped query
+        unit = self._unit(embedding) if not scope else None
+        with self._lock:
+            self._entries[key] = (created, n_results, value, unit)
+            self._entries.move_to_end(key)
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, created, n_results, json.dumps(value),
+                     unit.tobytes() if unit is not None else None)
+                )
+                self._db.commit()
+            overflow = len(self._entries) - self.max_items
+            if overflow > 0:
+                self._drop(list(self._entries)[:overflow])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "capacity": self.max_items,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses
+            }
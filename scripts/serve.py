@@ -0,0 +1,52 @@
+"""Production entry point: the API under waitress instead of Flask's debug server
+
+    pip install waitress
+    python scripts/serve.py --port 5001
+
+One process holds the embedding model, Chroma client and collage pool; requests
+are handled by a fixed pool of threads that share them. Query routes may hold
+at most QUERY_SLOTS threads, and --reserve threads are kept on top of that, so
+slow generations never starve /api/health, /api/ready or static assets.
+"""
+import argparse
+import logging
+import os
+
+from waitress import serve
+
+import api
+
+log = logging.getLogger("portrait.serve")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the portrait-of-inquiry API with waitress")
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5001)))
+    parser.add_argument('--reserve', type=int, default=int(os.environ.get('RESERVED_THREADS', 4)),
+                        help="threads kept free of query routes for health checks and static files")
+    parser.add_argument('--static-max-age', type=int, default=int(os.environ.get('STATIC_MAX_AGE', 3600)),
+                        help="Cache-Control max-age for static files, in seconds")
+    parser.add_argument('--no-warm-up', action='store_true', help="skip the warm-up embedding and generation")
+    args = parser.parse_args()
+
+    api.configure_logging()
+    app = api.create_app(warm_up=not args.no_warm_up, static_max_age=args.static_max_age)
+
+    threads = api.QUERY_SLOTS + args.reserve
+    log.info("Serving on http://%s:%d with %d threads (%d for queries)", args.host, args.port, threads, api.QUERY_SLOTS)
+    log.info("Models and collections are loading in the background (see /api/ready)")
+    serve(
+        app,
+        host=args.host,
+        port=args.port,
+        threads=threads,
+        # Connections beyond the thread pool wait in waitress's queue, not in a worker
+        connection_limit=threads * 8,
+        channel_timeout=120,
+        ident="portrait-of-inquiry"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Deterministic stand-in for the Ollama HTTP API, for offline benchmarks and demos
+
+    python scripts/stub_ollama.py --port 11435 --tokens-per-second 20
+    OLLAMA_HOST=http://127.0.0.1:11435 python scripts/serve.py
+
+Answers /api/chat and /api/generate (streamed or not) with the same canned
+reply every time, paced like a real model: a fixed prompt-evaluation delay,
+then one token per 1/tokens_per_second seconds.
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "Consider how a question folds back on the one asking it. "
+    "Your notes on situated knowledge meet a late-night conversation about drawing, "
+    "and somewhere between them is a hand moving across paper. What would you draw first?"
+)
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Pacing and reply tokens are read from attributes start_stub() sets on the server"""
+    protocol_version = 'HTTP/1.1'
+    server_version = "stub-ollama"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path == '/api/version':
+            self._send_json({"version": "0.0.0-stub"})
+        elif self.path == '/api/tags':
+            self._send_json({"models": [{"name": "llama3.2:latest", "model": "llama3.2:latest"}]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if self.path not in ('/api/chat', '/api/generate'):
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        chat = self.path == '/api/chat'
+        options = request.get('options') or {}
+        # An empty generate prompt only loads the model
+        if not chat and not request.get('prompt'):
+            tokens = []
+        else:
+            tokens = self.server.tokens[:options.get('num_predict') or len(self.server.tokens)]
+
+        time.sleep(self.server.prompt_delay)
+        if request.get('stream', True):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for token in tokens:
+                time.sleep(1 / self.server.tokens_per_second)
+                self._write_chunk(self._message(request, chat, token, done=False))
+            self._write_chunk(self._message(request, chat, "", done=True, eval_count=len(tokens)))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(len(tokens) / self.server.tokens_per_second)
+            self._send_json(self._message(request, chat, "".join(tokens), done=True, eval_count=len(tokens)))
+
+    def _write_chunk(self, body):
+        data = (json.dumps(body) + "\n").encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _message(self, request, chat, text, done, eval_count=0):
+        body = {
+            "model": request.get('model', 'llama3.2'),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": done
+        }
+        if chat:
+            body["message"] = {"role": "assistant", "content": text}
+        else:
+            body["response"] = text
+        if done:
+            body.update(
+                done_reason="stop",
+                total_duration=int((self.server.prompt_delay + eval_count / self.server.tokens_per_second) * 1e9),
+                load_duration=0,
+                prompt_eval_count=len(json.dumps(request.get('messages') or request.get('prompt'))) // 4,
+                prompt_eval_duration=int(self.server.prompt_delay * 1e9),
+                eval_count=eval_count,
+                eval_duration=int(eval_count / self.server.tokens_per_second * 1e9)
+            )
+        return body
+
+
+def start_stub(host='127.0.0.1', port=11435, prompt_delay=0.2, tokens_per_second=20.0, reply=REPLY):
+    """Run the stub on a background thread; returns the server (call shutdown() to stop)"""
+    server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+    server.daemon_threads = True
+    server.prompt_delay = prompt_delay
+    server.tokens_per_second = tokens_per_second
+    # Whitespace-led words stand in for tokens
+    server.tokens = [word if i == 0 else " " + word for i, word in enumerate(reply.split())]
+    threading.Thread(target=server.serve_forever, name="stub-ollama", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a deterministic fake Ollama API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--prompt-delay', type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=20.0)
+    args = parser.parse_args()
+
+    server = start_stub(args.host, args.port, args.prompt_delay, args.tokens_per_second)
+    print(f"Stub Ollama listening on http://{args.host}:{args.port} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
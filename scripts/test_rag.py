@@ -1,20 +1,14 @@
-import chromadb
-from chromadb.utils import embedding_functions
+import os
+import sys
 
-# Connect to your database
-client = chromadb.PersistentClient(path="./rag/chroma_db")
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rag'))
+from query_engine import RetrievalEngine
 
-# Get your collection
-collection = client.get_collection(
-    name="dialogic_inquiry",
-    embedding_function=sentence_transformer_ef
-)
+# Connect to your database
+engine = RetrievalEngine()
 
 # Check how many items are stored
-print(f"Total documents in collection: {collection.count()}")
+print(f"Total documents in collection: {engine.counts()['dialogic']}")
 print("\n" + "="*60 + "\n")
 
 # Test query - replace with something relevant to your conversations
@@ -23,16 +17,15 @@ test_query = "data visualization"  # Change this to match your content
 print(f"Testing query: '{test_query}'")
 print("\n" + "="*60 + "\n")
 
-results = collection.query(
-    query_texts=[test_query],
-    n_results=3  # Get top 3 most relevant results
-)
+retrieval = engine.retrieve(test_query, k=3)  # Get top 3 most relevant results
 
 # Display results
-for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
+for i, source in enumerate(retrieval.dialogic):
+    metadata = source.metadata
     print(f"Result {i+1}:")
     print(f"Role: {metadata['role']}")
     print(f"Conversation: {metadata['conversation_title']}")
     print(f"Timestamp: {metadata['timestamp']}")
-    print(f"Content preview: {doc[:200]}...")  # First 200 chars
-    print("\n" + "-"*60 + "\n")
\ No newline at end of file
+    print(f"Distance: {source.distance}")
+    print(f"Content preview: {source.content[:200]}...")  # First 200 chars
+    print("\n" + "-"*60 + "\n")
@@ -1,60 +1,53 @@
+import argparse
+
 import chromadb
-from chromadb.utils import embedding_functions
+
+from ingest import BACKENDS, CHROMA_PATH, EMBEDDING_BACKEND, Manifest, TokenChunker, iter_note_rows, lexical_builder, load_embedder, run_ingestion
+
+NOTES_PATH = 'assets/fall25class_notes.txt'
+
+parser = argparse.ArgumentParser(description="Vectorize class notes into Chroma")
+parser.add_argument('--batch-size', type=int, default=64, help="chunks embedded per encode call")
+parser.add_argument('--rebuild', action='store_true', help="drop the collection and re-embed everything")
+parser.add_argument('--embedding-backend', choices=BACKENDS, default=EMBEDDING_BACKEND,
+                    help="torch (sentence-transformers) or the exported ONNX model")
+parser.add_argument('--max-tokens', type=int, help="tokens per chunk (default: the model's sequence length)")
+parser.add_argument('--overlap', type=int, default=32, help="tokens shared by consecutive windows of a long paragraph")
+args = parser.parse_args()
 
 # Initialize Chroma client
-client = chromadb.PersistentClient(path="./rag/chroma_db")
+client = chromadb.PersistentClient(path=CHROMA_PATH)
 
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
+# Same model for stored documents and for queries (torch or ONNX, free, local)
+embedder = load_embedder(args.embedding_backend)
+
+# Paragraphs are packed up to the model's window, measured with its own tokenizer
+chunker = TokenChunker.for_embedder(embedder, args.max_tokens, overlap=args.overlap, merge_below=None)
 
 # Create collection for intellectual inquiry
 collection = client.get_or_create_collection(
     name="intellectual_inquiry",
-    embedding_function=sentence_transformer_ef
+    embedding_function=embedder
 )
 
-# Read your notes file
-with open('assets/fall25class_notes.txt', 'r', encoding='utf-8') as f:
-    content = f.read()
-
-print(f"Total characters in notes: {len(content)}")
+# Manifest of already-embedded IDs makes re-runs incremental
+manifest = Manifest("intellectual_inquiry")
+if args.rebuild:
+    client.delete_collection("intellectual_inquiry")
+    collection = client.create_collection(name="intellectual_inquiry", embedding_function=embedder)
+    manifest.clear()
 
 # Smart chunking - split by double newlines (paragraphs) but keep chunks reasonable
-chunks = []
-current_chunk = ""
-paragraphs = content.split('\n\n')
-
-for para in paragraphs:
-    para = para.strip()
-    if not para:
-        continue
-    
-    # If adding this paragraph would make chunk too long, save current chunk
-    if len(current_chunk) + len(para) > 1000:  # ~1000 chars per chunk
-        if current_chunk:
-            chunks.append(current_chunk)
-        current_chunk = para
-    else:
-        current_chunk += "\n\n" + para if current_chunk else para
-
-# Add the last chunk
-if current_chunk:
-    chunks.append(current_chunk)
-
-print(f"Created {len(chunks)} chunks from notes")
 print("Starting vectorization...")
+added, removed = run_ingestion(
+    collection,
+    iter_note_rows(NOTES_PATH, chunker),
+    embedder,
+    batch_size=args.batch_size,
+    manifest=manifest,
+    label="chunks",
+    lexical=lexical_builder("intellectual_inquiry")
+)
 
-# Add to Chroma
-for idx, chunk in enumerate(chunks):
-    collection.add(
-        documents=[chunk],
-        metadatas=[{"source": "class_notes", "chunk_id": idx}],
-        ids=[f"note_{idx}"]
-    )
-    
-    if (idx + 1) % 50 == 0:
-        print(f"Processed {idx + 1}/{len(chunks)} chunks...")
-
-print(f"✓ Notes vectorization complete! {len(chunks)} chunks added")
-print(f"Database saved at: ./rag/chroma_db")
\ No newline at end of file
+print(f"✓ Notes vectorization complete! {added} chunks added, {removed} removed, {collection.count()} total")
+print(f"Database saved at: {CHROMA_PATH}")
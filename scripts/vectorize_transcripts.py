@@ -1,51 +1,56 @@
+import argparse
+
 import chromadb
-import pandas as pd
-from chromadb.utils import embedding_functions
+
+from ingest import BACKENDS, CHROMA_PATH, EMBEDDING_BACKEND, Manifest, TokenChunker, iter_transcript_rows, lexical_builder, load_embedder, run_ingestion
+
+parser = argparse.ArgumentParser(description="Vectorize ChatGPT transcripts into Chroma")
+parser.add_argument('--batch-size', type=int, default=256, help="chunks embedded per encode call")
+parser.add_argument('--rebuild', action='store_true', help="drop the collection and re-embed everything")
+parser.add_argument('--embedding-backend', choices=BACKENDS, default=EMBEDDING_BACKEND,
+                    help="torch (sentence-transformers) or the exported ONNX model")
+parser.add_argument('--max-tokens', type=int, help="tokens per chunk (default: the model's sequence length)")
+parser.add_argument('--overlap', type=int, default=32, help="tokens shared by consecutive windows of a long message")
+parser.add_argument('--merge-below', type=int, default=48,
+                    help="adjacent turns of a conversation are merged while either has fewer tokens than this")
+parser.add_argument('--max-windows', type=int,
+                    help="index at most this many windows of one long message; the rest is not searchable (default: all)")
+args = parser.parse_args()
 
 # Initialize Chroma client
-client = chromadb.PersistentClient(path="./rag/chroma_db")
+client = chromadb.PersistentClient(path=CHROMA_PATH)
 
-# Use sentence transformers for embeddings (free, local)
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
+# Same model for stored documents and for queries (torch or ONNX, free, local)
+embedder = load_embedder(args.embedding_backend)
+
+# Chunks are measured with the same model's tokenizer: short turns merged, long ones windowed
+chunker = TokenChunker.for_embedder(embedder, args.max_tokens, overlap=args.overlap,
+                                    merge_below=args.merge_below, max_windows=args.max_windows or None)
 
 # Create collection for dialogic inquiry
 collection = client.get_or_create_collection(
     name="dialogic_inquiry",
-    embedding_function=sentence_transformer_ef
+    embedding_function=embedder
 )
 
-# Load your cleaned transcripts
-df = pd.read_csv('assets/cleaned_chatgpt_history.csv')
-
-print(f"Total messages in CSV: {len(df)}")
+# Manifest of already-embedded IDs makes re-runs incremental
+manifest = Manifest("dialogic_inquiry")
+if args.rebuild:
+    client.delete_collection("dialogic_inquiry")
+    collection = client.create_collection(name="dialogic_inquiry", embedding_function=embedder)
+    manifest.clear()
 
-# Filter out rows with empty content
-df = df.dropna(subset=['content'])  # Remove rows where content is NaN
-df = df[df['content'].str.strip() != '']  # Remove rows where content is just whitespace
-
-print(f"Messages with valid content: {len(df)}")
-
-# Add to Chroma
+# Stream your cleaned transcripts in batches (Parquet corpus, or the CSV if none exists)
 print("Starting vectorization...")
-for idx, row in df.iterrows():
-    try:
-        collection.add(
-            documents=[str(row['content'])],  # Ensure it's a string
-            metadatas=[{
-                "timestamp": str(row['timestamp']), 
-                "role": str(row['role']),
-                "conversation_title": str(row['conversation_title'])
-            }],
-            ids=[f"msg_{idx}"]
-        )
-        
-        if (idx + 1) % 100 == 0:
-            print(f"Processed {idx + 1}/{len(df)} messages...")
-    except Exception as e:
-        print(f"Error on row {idx}: {e}")
-        continue
-
-print(f"✓ Vectorization complete! {len(df)} messages added to Chroma DB")
-print(f"Database saved at: ./rag/chroma_db")
\ No newline at end of file
+added, removed = run_ingestion(
+    collection,
+    iter_transcript_rows(chunker, batch_size=args.batch_size),
+    embedder,
+    batch_size=args.batch_size,
+    manifest=manifest,
+    label="chunks",
+    lexical=lexical_builder("dialogic_inquiry")
+)
+
+print(f"✓ Vectorization complete! {added} chunks added, {removed} removed, {collection.count()} in Chroma DB")
+print(f"Database saved at: {CHROMA_PATH}")